@@ -7,22 +7,74 @@ Version: 1.5
 
 """
 
-from ..Script import Script
-from UM.Logger import Logger
-from UM.Application import Application
+import logging
+import mmap
+import os
 import re #To perform the search
-from cura.Settings.ExtruderManager import ExtruderManager
-from collections import namedtuple
+import sys
+from array import array
+from collections import OrderedDict, deque, namedtuple
 from enum import Enum
-from typing import List, Tuple
-from UM.Message import Message
-from UM.i18n import i18nCatalog
-catalog = i18nCatalog("cura")
+from functools import lru_cache
+from math import acos, atan2, ceil, cos, floor, hypot, pi, sin
+from time import perf_counter
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+# The rest of the Cura API is only imported by LinearlyVariableInfill.execute
+try:
+    from ..Script import Script
+    from UM.Logger import Logger
+except ImportError:
+    # Running outside of Cura (command line or batch use), only the gcode processing is available
+    Script = object
+
+    class Logger:
+        """Replacement of ``UM.Logger.Logger`` forwarding to the ``logging`` module."""
+
+        levels = {'d': logging.DEBUG, 'i': logging.INFO, 'w': logging.WARNING, 'e': logging.ERROR, 'c': logging.CRITICAL}
+
+        @classmethod
+        def log(cls, log_type: str, message: str) -> None:
+            logging.getLogger("LinearlyVariableInfill").log(cls.levels.get(log_type, logging.INFO), message)
 
 __version__ = '1.5'
 
+# Maximum number of point/segment pairs evaluated at once by the vectorized distance calculation
+BATCH_TILE_SIZE = 65536
+
+# Default memory bound of the cache of layer perimeters reused by identical layers
+PERIMETER_CACHE_BYTES = 64 * 1024 * 1024
+
+# Default size bound of the on-disk cache of rewritten layers
+LAYER_CACHE_BYTES = 512 * 1024 * 1024
+
+# Maximum deviation of the chords from the arc when G2/G3 arcs of the infill are linearized, in mm
+ARC_TOLERANCE = 0.01
+
+# Format of the log messages outside of Cura, also used by the worker processes
+LOG_FORMAT = "%(levelname)s: %(message)s"
+
 ##-----------------------------------------------------------------------------------------------------------------------------------------------------------------
 
+@lru_cache(maxsize=None)
+def load_numpy():
+    """Import NumPy on its first use.
+
+    Importing NumPy takes longer than the rest of the module, so the batch distance functions
+    load it when they are first called instead of at import.
+
+    Returns:
+        module: the ``numpy`` module, None when it is not installed; not every Cura build ships
+        NumPy, the scalar distance functions are used then
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+
+    return numpy
+
+
 Point2D = namedtuple('Point2D', 'x y')
 Segment = namedtuple('Segment', 'point1 point2')
 
@@ -32,6 +84,7 @@ class Infill(Enum):
     """Enum for infill type."""
 
     LINEAR = 1  # Linear infill like rectilinear or triangles
+    POLYLINE = 2  # Curved or connected infill written as chains of short moves, like gyroid or concentric
 
 class Section(Enum):
     """Enum for section type."""
@@ -91,11 +144,717 @@ def min_distance_to_segment(segment: Segment, segments: List[Segment]) -> float:
     Returns:
         float: the smallest distance from the midpoint of ``segment`` to the nearest segment in the list
     """
-    middlePoint = Point2D((segment.point1.x + segment.point2.x) / 2, (segment.point1.y + segment.point2.y) / 2)
+    middlePoint = segment_midpoint(segment)
 
     return min(dist(s, middlePoint) for s in segments)
 
 
+def segment_midpoint(segment: Segment) -> Point2D:
+    """Calculate the midpoint of a segment.
+
+    Args:
+        segment (Segment): segment to use for midpoint calculation
+
+    Returns:
+        Point2D: the midpoint of ``segment``
+    """
+    return Point2D((segment.point1.x + segment.point2.x) / 2, (segment.point1.y + segment.point2.y) / 2)
+
+
+class PerimeterStore:
+    """Perimeter segments of a layer in flat ``array('d')`` buffers.
+
+    The direction and squared length of every segment are computed once when it is appended,
+    and zero-length segments are dropped, so the distance queries only need a few
+    multiply-adds per candidate. The arithmetic is the same as in ``dist``, so the distances
+    are identical.
+    """
+
+    def __init__(self):
+        self.x1 = array('d')
+        self.y1 = array('d')
+        self.x2 = array('d')
+        self.y2 = array('d')
+        self.px = array('d')
+        self.py = array('d')
+        self.norm = array('d')
+
+    def __len__(self) -> int:
+        return len(self.norm)
+
+    def __getitem__(self, index: int) -> Segment:
+        return Segment(Point2D(self.x1[index], self.y1[index]), Point2D(self.x2[index], self.y2[index]))
+
+    def copy(self) -> 'PerimeterStore':
+        """Copy the perimeter, used before appending to a perimeter shared with the cache.
+
+        Returns:
+            PerimeterStore: a perimeter with the same segments
+        """
+        other = PerimeterStore()
+        for name in ('x1', 'y1', 'x2', 'y2', 'px', 'py', 'norm'):
+            setattr(other, name, array('d', getattr(self, name)))
+
+        return other
+
+    def nbytes(self) -> int:
+        """Memory used by the buffers."""
+        return 7 * 8 * len(self.norm)
+
+    def append(self, segment: Segment) -> bool:
+        """Add a segment to the perimeter.
+
+        Args:
+            segment (Segment): perimeter segment
+
+        Returns:
+            bool: False if the segment has zero length and was dropped
+        """
+        px = segment.point2.x - segment.point1.x
+        py = segment.point2.y - segment.point1.y
+        norm = px * px + py * py
+        if norm == 0:
+            return False
+        self.x1.append(segment.point1.x)
+        self.y1.append(segment.point1.y)
+        self.x2.append(segment.point2.x)
+        self.y2.append(segment.point2.y)
+        self.px.append(px)
+        self.py.append(py)
+        self.norm.append(norm)
+
+        return True
+
+    def distance(self, index: int, point: Point2D) -> float:
+        """Calculate the distance from a point to a stored segment, see ``dist``.
+
+        Args:
+            index (int): index of the segment
+            point (Point2D): point used for distance calculation
+
+        Returns:
+            float: distance between the segment and ``point``
+        """
+        x1 = self.x1[index]
+        y1 = self.y1[index]
+        px = self.px[index]
+        py = self.py[index]
+        u = ((point.x - x1) * px + (point.y - y1) * py) / self.norm[index]
+        if u > 1:
+            u = 1
+        elif u < 0:
+            u = 0
+        dx = x1 + u * px - point.x
+        dy = y1 + u * py - point.y
+
+        return (dx * dx + dy * dy) ** 0.5
+
+
+class PerimeterGrid:
+    """Uniform grid over the perimeter segments of a layer for nearest-wall distance queries.
+
+    Every segment is registered in all cells its bounding box overlaps. A query scans rings of
+    cells around the query point and stops as soon as the segments outside the scanned block
+    are provably farther than the best distance found, or farther than the query limit.
+    Distances are computed with the same arithmetic as ``dist`` on the same segments as the
+    brute-force search, so results below the limit are identical to ``min_distance_to_segment``.
+    """
+
+    def __init__(self, segments: PerimeterStore, cell_size: float):
+        """Create an empty grid; call ``sync`` to index the segments.
+
+        Args:
+            segments (PerimeterStore): perimeter segments of the layer, may grow between ``sync`` calls
+            cell_size (float): edge length of a grid cell in mm
+        """
+        self.segments = segments
+        self.cell_size = cell_size
+        self.cells = {}  # type: Dict[Tuple[int, int], List[int]]
+        self.indexed = 0
+        self.bounds = None  # type: Tuple[int, int, int, int]
+
+    def sync(self) -> None:
+        """Index the segments appended to ``segments`` since the last call."""
+        cell_size = self.cell_size
+        cells = self.cells
+        segments = self.segments
+        for index in range(self.indexed, len(segments)):
+            x1 = segments.x1[index]
+            y1 = segments.y1[index]
+            x2 = segments.x2[index]
+            y2 = segments.y2[index]
+            ix1 = floor(min(x1, x2) / cell_size)
+            ix2 = floor(max(x1, x2) / cell_size)
+            iy1 = floor(min(y1, y2) / cell_size)
+            iy2 = floor(max(y1, y2) / cell_size)
+            for ix in range(ix1, ix2 + 1):
+                for iy in range(iy1, iy2 + 1):
+                    cells.setdefault((ix, iy), []).append(index)
+            if self.bounds is None:
+                self.bounds = (ix1, iy1, ix2, iy2)
+            else:
+                bx1, by1, bx2, by2 = self.bounds
+                self.bounds = (min(bx1, ix1), min(by1, iy1), max(bx2, ix2), max(by2, iy2))
+        self.indexed = len(segments)
+
+    def nbytes(self) -> int:
+        """Estimated memory used by the cells."""
+        return sum(120 + 8 * len(indices) for indices in self.cells.values())
+
+    def min_distance(self, point: Point2D, limit: float) -> float:
+        """Calculate the distance from ``point`` to the nearest indexed segment.
+
+        Args:
+            point (Point2D): point used for distance calculation
+            limit (float): distance beyond which the exact value is not needed
+
+        Returns:
+            float: the exact distance if it is smaller than ``limit``, otherwise a value not smaller than ``limit``
+        """
+        if self.bounds is None:
+            return float("inf")
+        cell_size = self.cell_size
+        cells = self.cells
+        X1 = self.segments.x1
+        Y1 = self.segments.y1
+        PX = self.segments.px
+        PY = self.segments.py
+        NORM = self.segments.norm
+        x = point.x
+        y = point.y
+        cx = floor(x / cell_size)
+        cy = floor(y / cell_size)
+        bx1, by1, bx2, by2 = self.bounds
+        # slack against rounding in the cell assignment
+        slack = cell_size * 1e-9
+        best_squared = float("inf")
+        ring = 0
+        while True:
+            if ring == 0:
+                ring_cells = [(cx, cy)]
+            else:
+                ring_cells = [(cx + d, cy - ring) for d in range(-ring, ring + 1)]
+                ring_cells += [(cx + d, cy + ring) for d in range(-ring, ring + 1)]
+                ring_cells += [(cx - ring, cy + d) for d in range(-ring + 1, ring)]
+                ring_cells += [(cx + ring, cy + d) for d in range(-ring + 1, ring)]
+            for cell in ring_cells:
+                for index in cells.get(cell, ()):
+                    # inlined PerimeterStore.distance, compared squared
+                    x1 = X1[index]
+                    y1 = Y1[index]
+                    px = PX[index]
+                    py = PY[index]
+                    u = ((x - x1) * px + (y - y1) * py) / NORM[index]
+                    if u > 1:
+                        u = 1
+                    elif u < 0:
+                        u = 0
+                    dx = x1 + u * px - x
+                    dy = y1 + u * py - y
+                    squared = dx * dx + dy * dy
+                    if squared < best_squared:
+                        best_squared = squared
+            best = best_squared ** 0.5
+            # every segment outside the scanned block is at least this far away
+            bound = min(x - (cx - ring) * cell_size, (cx + ring + 1) * cell_size - x,
+                        y - (cy - ring) * cell_size, (cy + ring + 1) * cell_size - y) - slack
+            if best <= bound or bound >= limit:
+                return best
+            if cx - ring <= bx1 and cy - ring <= by1 and cx + ring >= bx2 and cy + ring >= by2:
+                return best
+            ring += 1
+
+    def candidates(self, x1: float, y1: float, x2: float, y2: float) -> List[int]:
+        """Collect the indexed segments in the cells overlapping a rectangle.
+
+        Args:
+            x1 (float): minimum X of the rectangle
+            y1 (float): minimum Y of the rectangle
+            x2 (float): maximum X of the rectangle
+            y2 (float): maximum Y of the rectangle
+
+        Returns:
+            List[int]: sorted indices of the segments, every segment touching the rectangle is included
+        """
+        if self.bounds is None:
+            return []
+        cell_size = self.cell_size
+        cells = self.cells
+        bx1, by1, bx2, by2 = self.bounds
+        found = set()
+        for ix in range(max(floor(x1 / cell_size), bx1), min(floor(x2 / cell_size), bx2) + 1):
+            for iy in range(max(floor(y1 / cell_size), by1), min(floor(y2 / cell_size), by2) + 1):
+                found.update(cells.get((ix, iy), ()))
+
+        return sorted(found)
+
+    def is_far(self, start: Point2D, end: Point2D, limit: float) -> bool:
+        """Check whether a whole move stays at least ``limit`` away from the indexed segments.
+
+        The segments around the bounding box of the move are measured against the move as a
+        whole: two segments are either crossing or their distance is reached at one of the four
+        end points. The check is conservative, a move within rounding of ``limit`` is not far.
+
+        Args:
+            start (Point2D): start of the move
+            end (Point2D): end of the move
+            limit (float): minimum distance to the walls
+
+        Returns:
+            bool: True if every point of the move is farther than ``limit`` from every segment
+        """
+        reach = limit + limit * 1e-6
+        move = Segment(start, end)
+        mx = end.x - start.x
+        my = end.y - start.y
+        for index in self.candidates(min(start.x, end.x) - reach, min(start.y, end.y) - reach,
+                                     max(start.x, end.x) + reach, max(start.y, end.y) + reach):
+            segment = self.segments[index]
+            point1, point2 = segment
+            if (dist(move, point1) < reach or dist(move, point2) < reach
+                    or dist(segment, start) < reach or dist(segment, end) < reach):
+                return False
+            # crossing: the end points of each segment are on opposite sides of the other
+            side1 = mx * (point1.y - start.y) - my * (point1.x - start.x)
+            side2 = mx * (point2.y - start.y) - my * (point2.x - start.x)
+            sx = point2.x - point1.x
+            sy = point2.y - point1.y
+            side3 = sx * (start.y - point1.y) - sy * (start.x - point1.x)
+            side4 = sx * (end.y - point1.y) - sy * (end.x - point1.x)
+            if (side1 < 0) != (side2 < 0) and (side3 < 0) != (side4 < 0):
+                return False
+
+        return True
+
+    def min_distances(self, points: List[Point2D], limit: float, tile_size: int = BATCH_TILE_SIZE) -> List[float]:
+        """Calculate the distance from each point to the nearest indexed segment.
+
+        With NumPy available the distances are calculated in one vectorized batch against the
+        segments around the bounding box of ``points``, otherwise ``min_distance`` is called per point.
+
+        Args:
+            points (List[Point2D]): points used for distance calculation
+            limit (float): distance beyond which the exact value is not needed
+            tile_size (int): maximum number of point/segment pairs evaluated at once
+
+        Returns:
+            List[float]: for every point the exact distance if it is smaller than ``limit``, otherwise a value not smaller than ``limit``
+        """
+        np = load_numpy()
+        if np is None or self.bounds is None or not points:
+            return [self.min_distance(point, limit) for point in points]
+        candidates = self.candidates(min(point.x for point in points) - limit, min(point.y for point in points) - limit,
+                                     max(point.x for point in points) + limit, max(point.y for point in points) + limit)
+        if not candidates:
+            return [float("inf")] * len(points)
+
+        squared = min_distances_batch(np.array(points, dtype=float), self.segment_array(candidates), tile_size, squared=True)
+
+        # square root with the same pow as dist, so the results are bit-identical to the scalar path
+        return [distance ** 0.5 for distance in squared.tolist()]
+
+    def min_distances_on_line(self, points: List[Point2D], limit: float) -> List[float]:
+        """Calculate the distance from collinear points to the nearest indexed segment with a line sweep.
+
+        ``points`` are the ordered, evenly spaced sub-segment midpoints of a straight move. For
+        every segment near the move the interval of the line closer than ``limit`` to it is
+        calculated once; the line intersects the capsule around a segment in a single
+        interval. The intervals are swept along the points, so every point only measures
+        the segments whose interval covers it, and a point covered by no interval is farther
+        than ``limit`` from every wall. The covering distances use the same arithmetic as
+        ``dist``, so results below ``limit`` are identical to ``min_distance``.
+
+        Args:
+            points (List[Point2D]): collinear points ordered along the line, at most one cell size apart
+            limit (float): distance beyond which the exact value is not needed
+
+        Returns:
+            List[float]: for every point the exact distance if it is smaller than ``limit``, otherwise infinite
+        """
+        infinite = float("inf")
+        if self.bounds is None or not points:
+            return [infinite] * len(points)
+        first = points[0]
+        last = points[-1]
+        length = two_points_distance(first, last)
+        if length == 0:
+            return [self.min_distance(point, limit) for point in points]
+        ux = (last.x - first.x) / length
+        uy = (last.y - first.y) / length
+
+        # segments in the cells around the points, the points are closer than one cell to each other
+        cell_size = self.cell_size
+        cells = self.cells
+        near_cells = set()
+        for point in points:
+            cx = floor(point.x / cell_size)
+            cy = floor(point.y / cell_size)
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    near_cells.add((cx + dx, cy + dy))
+        candidates = set()
+        for cell in near_cells:
+            candidates.update(cells.get(cell, ()))
+
+        segments = self.segments
+        X1 = segments.x1
+        Y1 = segments.y1
+        X2 = segments.x2
+        Y2 = segments.y2
+        PX = segments.px
+        PY = segments.py
+        NORM = segments.norm
+        limit_squared = limit * limit
+        # widening of the intervals against rounding, points off the line by rounding stay covered
+        pad = limit * 1e-6
+        reach = limit + pad
+        end = (last.x - first.x) * ux + (last.y - first.y) * uy
+        intervals = []
+        for index in candidates:
+            # skip segments entirely on one side of the line or beyond its ends by more than the limit
+            ax = X1[index] - first.x
+            ay = Y1[index] - first.y
+            bx = X2[index] - first.x
+            by = Y2[index] - first.y
+            side1 = ax * uy - ay * ux
+            side2 = bx * uy - by * ux
+            if (side1 >= reach and side2 >= reach) or (side1 <= -reach and side2 <= -reach):
+                continue
+            along1 = ax * ux + ay * uy
+            along2 = bx * ux + by * uy
+            if (along1 <= -reach and along2 <= -reach) or (along1 >= end + reach and along2 >= end + reach):
+                continue
+            low = infinite
+            high = -infinite
+            # discs around the end points
+            for ex, ey in ((X1[index], Y1[index]), (X2[index], Y2[index])):
+                ax = first.x - ex
+                ay = first.y - ey
+                b = ax * ux + ay * uy
+                discriminant = b * b - (ax * ax + ay * ay - limit_squared)
+                if discriminant > 0:
+                    root = discriminant ** 0.5
+                    low = min(low, -b - root)
+                    high = max(high, -b + root)
+            # band along the segment: projection within the segment and perpendicular distance below the limit
+            segment_length = NORM[index] ** 0.5
+            wx = PX[index] / segment_length
+            wy = PY[index] / segment_length
+            ax = first.x - X1[index]
+            ay = first.y - Y1[index]
+            band_low = -infinite
+            band_high = infinite
+            for offset, slope, minimum, maximum in ((ax * wx + ay * wy, ux * wx + uy * wy, 0.0, segment_length),
+                                                    (ax * wy - ay * wx, ux * wy - uy * wx, -limit, limit)):
+                if slope == 0:
+                    if not minimum <= offset <= maximum:
+                        band_low = infinite
+                        band_high = -infinite
+                    continue
+                t1 = (minimum - offset) / slope
+                t2 = (maximum - offset) / slope
+                if t1 > t2:
+                    t1, t2 = t2, t1
+                band_low = max(band_low, t1)
+                band_high = min(band_high, t2)
+            if band_low <= band_high:
+                low = min(low, band_low)
+                high = max(high, band_high)
+            if low <= high:
+                intervals.append((low - pad, high + pad, index))
+        intervals.sort()
+
+        result = []
+        active = []
+        next_interval = 0
+        for point in points:
+            x = point.x
+            y = point.y
+            position = (x - first.x) * ux + (y - first.y) * uy
+            while next_interval < len(intervals) and intervals[next_interval][0] <= position:
+                active.append(intervals[next_interval])
+                next_interval += 1
+            active = [interval for interval in active if interval[1] >= position]
+            best_squared = infinite
+            for _, _, index in active:
+                x1 = X1[index]
+                y1 = Y1[index]
+                px = PX[index]
+                py = PY[index]
+                u = ((x - x1) * px + (y - y1) * py) / NORM[index]
+                if u > 1:
+                    u = 1
+                elif u < 0:
+                    u = 0
+                dx = x1 + u * px - x
+                dy = y1 + u * py - y
+                squared = dx * dx + dy * dy
+                if squared < best_squared:
+                    best_squared = squared
+            result.append(best_squared ** 0.5)
+
+        return result
+
+    def segment_array(self, indices: List[int]):
+        """Copy indexed segments into a NumPy array for ``min_distances_batch``.
+
+        Args:
+            indices (List[int]): indices of the segments
+
+        Returns:
+            numpy.ndarray: (len(indices), 2, 2) array of the segments
+        """
+        np = load_numpy()
+        index = np.array(indices, dtype=np.intp)
+        segments = self.segments
+        array = np.empty((len(index), 2, 2))
+        array[:, 0, 0] = np.frombuffer(segments.x1)[index]
+        array[:, 0, 1] = np.frombuffer(segments.y1)[index]
+        array[:, 1, 0] = np.frombuffer(segments.x2)[index]
+        array[:, 1, 1] = np.frombuffer(segments.y2)[index]
+
+        return array
+
+
+class DistanceField:
+    """Raster of the distance to the perimeter for approximate O(1) wall-distance lookups.
+
+    The exact distance is calculated at the nodes of a square raster with ``resolution``
+    spacing, clipped to ``limit``; only the band of nodes within ``limit`` of every segment
+    is measured against that segment, the rest of the raster keeps ``limit``. A lookup
+    interpolates the four surrounding nodes bilinearly. As the distance changes by at most
+    the distance travelled, the error of a lookup below ``limit`` is at most
+    ``resolution * sqrt(2) / 2`` (0.035 mm at 0.05 mm resolution).
+
+    Building the raster costs more than the exact queries of one layer; it pays off when the
+    layers with the same inner walls reuse it from the ``PerimeterCache``. The raster covers
+    the bounding box of the perimeter extended by ``limit`` and holds one float32 per node
+    (16 MB for a 100 x 100 mm layer at 0.05 mm). Requires NumPy.
+    """
+
+    def __init__(self, grid: PerimeterGrid, resolution: float, limit: float, tile_size: int = BATCH_TILE_SIZE):
+        """Rasterize the distance to the segments of a grid.
+
+        Args:
+            grid (PerimeterGrid): the perimeter
+            resolution (float): distance between the raster nodes in mm
+            limit (float): distance where the raster is clipped
+            tile_size (int): maximum number of point/segment pairs evaluated at once
+        """
+        np = load_numpy()
+        segments = grid.segments
+        self.resolution = resolution
+        self.limit = limit
+        self.x0 = min(min(segments.x1), min(segments.x2)) - limit
+        self.y0 = min(min(segments.y1), min(segments.y2)) - limit
+        columns = int(ceil((max(max(segments.x1), max(segments.x2)) + limit - self.x0) / resolution)) + 1
+        rows = int(ceil((max(max(segments.y1), max(segments.y2)) + limit - self.y0) / resolution)) + 1
+        self.values = np.full((rows, columns), limit, dtype=np.float32)
+
+        # every segment only lowers the nodes of its band, long segments are cut into pieces
+        # not longer than the limit so that the bounding boxes of the bands stay small
+        for index in range(len(segments)):
+            x1, y1, x2, y2 = segments.x1[index], segments.y1[index], segments.x2[index], segments.y2[index]
+            pieces = max(1, int(ceil(hypot(x2 - x1, y2 - y1) / limit)))
+            for piece in range(pieces):
+                ax = x1 + (x2 - x1) * piece / pieces
+                ay = y1 + (y2 - y1) * piece / pieces
+                bx = x1 + (x2 - x1) * (piece + 1) / pieces
+                by = y1 + (y2 - y1) * (piece + 1) / pieces
+                i1 = max(int(ceil((min(ax, bx) - limit - self.x0) / resolution)), 0)
+                i2 = min(int(floor((max(ax, bx) + limit - self.x0) / resolution)) + 1, columns)
+                j1 = max(int(ceil((min(ay, by) - limit - self.y0) / resolution)), 0)
+                j2 = min(int(floor((max(ay, by) + limit - self.y0) / resolution)) + 1, rows)
+                if i1 >= i2 or j1 >= j2:
+                    continue
+                node_x, node_y = np.meshgrid(self.x0 + np.arange(i1, i2) * resolution, self.y0 + np.arange(j1, j2) * resolution)
+                nodes = np.column_stack((node_x.ravel(), node_y.ravel()))
+                distances = min_distances_batch(nodes, np.array([[[ax, ay], [bx, by]]]), tile_size)
+                window = self.values[j1:j2, i1:i2]
+                np.minimum(window, distances.reshape(j2 - j1, i2 - i1), out=window, casting='unsafe')
+
+    def min_distances(self, points: List[Point2D], limit: float) -> List[float]:
+        """Look up the approximate distance from each point to the perimeter.
+
+        Args:
+            points (List[Point2D]): points used for distance calculation
+            limit (float): distance beyond which the exact value is not needed, at most the limit of the field
+
+        Returns:
+            List[float]: for every point the interpolated distance, clipped to the limit of the field
+        """
+        if not points:
+            return []
+        np = load_numpy()
+        rows, columns = self.values.shape
+        coordinates = np.array(points, dtype=float)
+        fx = (coordinates[:, 0] - self.x0) / self.resolution
+        fy = (coordinates[:, 1] - self.y0) / self.resolution
+        inside = (fx >= 0) & (fx <= columns - 1) & (fy >= 0) & (fy <= rows - 1)
+        i = np.clip(np.floor(fx).astype(np.intp), 0, columns - 2)
+        j = np.clip(np.floor(fy).astype(np.intp), 0, rows - 2)
+        tx = np.clip(fx - i, 0, 1)
+        ty = np.clip(fy - j, 0, 1)
+        values = self.values
+        distances = ((values[j, i] * (1 - tx) + values[j, i + 1] * tx) * (1 - ty)
+                     + (values[j + 1, i] * (1 - tx) + values[j + 1, i + 1] * tx) * ty)
+        # outside of the raster every point is farther than the limit
+        distances[~inside] = self.limit
+
+        return distances.tolist()
+
+    def min_distances_on_line(self, points: List[Point2D], limit: float) -> List[float]:
+        """Look up the approximate distance from collinear points, see ``min_distances``."""
+        return self.min_distances(points, limit)
+
+
+def perimeter_key(segments: PerimeterStore) -> bytes:
+    """Hash the geometry of a perimeter to recognize identical layers.
+
+    Args:
+        segments (PerimeterStore): perimeter segments
+
+    Returns:
+        bytes: digest of the segment coordinates
+    """
+    import hashlib
+    digest = hashlib.blake2b(digest_size=16)
+    for buffer in (segments.x1, segments.y1, segments.x2, segments.y2):
+        digest.update(buffer)
+
+    return digest.digest()
+
+
+class CachedPerimeter:
+    """Perimeter of a layer with its grid and, in the approximate mode, its distance field."""
+
+    __slots__ = ('segments', 'grid', 'field')
+
+    def __init__(self, segments: PerimeterStore, grid: PerimeterGrid):
+        self.segments = segments
+        self.grid = grid
+        self.field = None  # type: Optional[DistanceField]
+
+    def nbytes(self) -> int:
+        """Estimated memory used by the perimeter, the grid and the field."""
+        size = self.segments.nbytes() + self.grid.nbytes()
+        if self.field is not None:
+            size += self.field.values.nbytes
+
+        return size
+
+
+class PerimeterCache:
+    """Least recently used cache of layer perimeters keyed by ``perimeter_key``.
+
+    Prismatic parts have the same inner walls on many consecutive layers, those layers reuse
+    the grid and distance field built for the first one. The cache is bounded by the
+    estimated memory of its entries, except the most recently added one, which is kept even
+    when it is larger than the bound so that the next layers can reuse it; ``hits``,
+    ``misses`` and ``evictions`` count the lookups.
+    """
+
+    def __init__(self, max_bytes: int = PERIMETER_CACHE_BYTES):
+        """Create an empty cache.
+
+        Args:
+            max_bytes (int): memory bound of the entries
+        """
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # type: OrderedDict
+        self.sizes = {}  # type: Dict[bytes, int]
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: bytes) -> Optional[CachedPerimeter]:
+        """Look up a perimeter.
+
+        Args:
+            key (bytes): key of the perimeter
+
+        Returns:
+            Optional[CachedPerimeter]: the cached perimeter, None if it is not cached
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+
+        return entry
+
+    def put(self, key: bytes, entry: CachedPerimeter) -> None:
+        """Add or update a perimeter and evict the least recently used other ones above the memory bound.
+
+        Args:
+            key (bytes): key of the perimeter
+            entry (CachedPerimeter): the perimeter
+        """
+        self.size -= self.sizes.pop(key, 0)
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        self.sizes[key] = entry.nbytes()
+        self.size += self.sizes[key]
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            evicted, _ = self.entries.popitem(last=False)
+            self.size -= self.sizes.pop(evicted)
+            self.evictions += 1
+
+    def stats(self) -> str:
+        """Describe the counters for the log."""
+        return 'Perimeter cache : {} hits / {} misses / {} evictions / {} entries / {} bytes'.format(
+            self.hits, self.misses, self.evictions, len(self.entries), self.size)
+
+
+def min_distances_batch(points, segments, tile_size: int = BATCH_TILE_SIZE, squared: bool = False):
+    """Calculate the minimum distance from every point to the nearest segment with NumPy.
+
+    The point/segment pairs are processed in tiles of at most ``tile_size`` elements, so the
+    memory use is bounded regardless of the number of points and segments.
+
+    Args:
+        points (numpy.ndarray): (N, 2) array of points
+        segments (numpy.ndarray): (M, 2, 2) array of segments, ``segments[i] = (point1, point2)``
+        tile_size (int): maximum number of point/segment pairs evaluated at once
+        squared (bool): return the squared distances
+
+    Returns:
+        numpy.ndarray: (N,) array of the smallest distances, infinite when ``segments`` is empty
+    """
+    np = load_numpy()
+    result = np.full(len(points), np.inf)
+    if len(points) == 0 or len(segments) == 0:
+        return result
+    x1 = segments[:, 0, 0]
+    y1 = segments[:, 0, 1]
+    px = segments[:, 1, 0] - x1
+    py = segments[:, 1, 1] - y1
+    norm = px * px + py * py
+    # zero-length segments degrade to their first point
+    norm[norm == 0] = 1.0
+    columns = min(len(segments), max(1, tile_size))
+    rows = max(1, tile_size // columns)
+    for row in range(0, len(points), rows):
+        point_x = points[row:row + rows, 0:1]
+        point_y = points[row:row + rows, 1:2]
+        best = np.full(len(point_x), np.inf)
+        for column in range(0, len(segments), columns):
+            tile = slice(column, column + columns)
+            u = ((point_x - x1[tile]) * px[tile] + (point_y - y1[tile]) * py[tile]) / norm[tile]
+            np.clip(u, 0, 1, out=u)
+            dx = x1[tile] + u * px[tile] - point_x
+            dy = y1[tile] + u * py[tile] - point_y
+            np.minimum(best, (dx * dx + dy * dy).min(axis=1), out=best)
+        result[row:row + rows] = best
+    if not squared:
+        np.sqrt(result, out=result)
+
+    return result
+
+
 def getXY(currentLineINcode: str) -> Point2D:
     """Create a ``Point2D`` object from a gcode line.
 
@@ -108,15 +867,91 @@ def getXY(currentLineINcode: str) -> Point2D:
     Returns:
         Point2D: the parsed coordinates
     """
-    searchX = re.search(r"X(\d*\.?\d*)", currentLineINcode)
-    searchY = re.search(r"Y(\d*\.?\d*)", currentLineINcode)
-    if searchX and searchY:
-        elementX = searchX.group(1)
-        elementY = searchY.group(1)
-    else:
-        raise SyntaxError('Gcode file parsing error for line {currentLineINcode}')
+    line = parse_line(currentLineINcode)
+    if line.x is None or line.y is None:
+        raise SyntaxError('Gcode file parsing error for line {}'.format(currentLineINcode))
+
+    return Point2D(line.x, line.y)
+
+
+# A gcode word: letter followed by a signed number, e.g. ``X-12.5``
+GCODE_WORD = re.compile(r"([A-Za-z])\s*([-+]?(?:\d+\.?\d*|\.\d+))")
+# Feedrate word of a gcode line with its leading whitespace
+FEED_WORD = re.compile(r"\s*[Ff]\s*[-+]?(?:\d+\.?\d*|\.\d+)")
+
+
+class GcodeLine:
+    """A gcode line parsed into its command, coordinates, extrusion, feedrate and comment.
+
+    Parameters missing from the line are None, ``command`` is None for comment-only and empty
+    lines. ``i``, ``j`` and ``r`` are the center offset and radius of G2/G3 arcs. The original
+    ``text`` is kept for lines that are passed through unchanged.
+    """
+
+    __slots__ = ('text', 'command', 'x', 'y', 'e', 'f', 'i', 'j', 'r', 'comment')
+
+    def __init__(self, text: str, command: Optional[str] = None, x: Optional[float] = None, y: Optional[float] = None,
+                 e: Optional[float] = None, f: Optional[float] = None, comment: Optional[str] = None):
+        self.text = text
+        self.command = command
+        self.x = x
+        self.y = y
+        self.e = e
+        self.f = f
+        self.i = None
+        self.j = None
+        self.r = None
+        self.comment = comment
+
+    def __repr__(self):
+        return "GcodeLine({!r})".format(self.text)
+
+
+def parse_line(text: str) -> GcodeLine:
+    """Parse a gcode line in a single pass.
+
+    Args:
+        text (str): gcode line
+
+    Returns:
+        GcodeLine: the parsed line
+    """
+    code, separator, comment = text.partition(";")
+    line = GcodeLine(text, comment=comment if separator else None)
+    for letter, value in GCODE_WORD.findall(code):
+        letter = letter.upper()
+        if letter == 'X':
+            line.x = float(value)
+        elif letter == 'Y':
+            line.y = float(value)
+        elif letter == 'E':
+            line.e = float(value)
+        elif letter == 'F':
+            line.f = float(value)
+        elif letter == 'I':
+            line.i = float(value)
+        elif letter == 'J':
+            line.j = float(value)
+        elif letter == 'R':
+            line.r = float(value)
+        elif line.command is None and letter in 'GMT':
+            # G01 and G1 are the same command
+            line.command = letter + (value.lstrip('0') or '0')
+
+    return line
+
+
+def tokenize(lines: Iterable[str]) -> Iterator[GcodeLine]:
+    """Parse gcode lines, see ``parse_line``.
 
-    return Point2D(float(elementX), float(elementY))
+    Args:
+        lines (Iterable[str]): gcode lines
+
+    Yields:
+        GcodeLine: the parsed line
+    """
+    for text in lines:
+        yield parse_line(text)
 
 
 def mapRange(a: Tuple[float, float], b: Tuple[float, float], s: float) -> float:
@@ -153,6 +988,198 @@ def gcode_template(x: float, y: float, extrusion: float) -> str:
     return "G1 X{} Y{} E{}".format(round(x, 3), round(y, 3), round(extrusion, 5))
 
 
+# Trailing zeros of the fixed point numbers formatted by gcode_moves, the first decimal is kept
+FIXED_TRAILING_ZEROS = re.compile(r"(\.\d+?)0+(?=[ \n])")
+
+
+def gcode_moves(points: List[Point2D], extrusions: List[float], feeds: List[str]) -> str:
+    """Format the gcode lines of the sub-segments of a move at once.
+
+    The numbers are formatted with fixed 3 and 5 decimals and the trailing zeros are removed
+    from the whole batch, which gives the same text as ``gcode_template``. Extrusions below
+    1e-4 are written in exponent notation by ``round``, those moves use ``gcode_template``.
+
+    Args:
+        points (List[Point2D]): end points of the sub-segments
+        extrusions (List[float]): extrusion values at the end points
+        feeds (List[str]): feedrate suffix of every line, e.g. ``" F1800"`` or ``""``
+
+    Returns:
+        str: the gcode lines, every line ends with a newline
+    """
+    if min(map(abs, extrusions)) < 1e-4:
+        return "".join([gcode_template(point.x, point.y, extrusion) + feed + "\n" for point, extrusion, feed in zip(points, extrusions, feeds)])
+
+    return FIXED_TRAILING_ZEROS.sub(r"\1", "".join(["G1 X%.3f Y%.3f E%.5f%s\n" % (point.x, point.y, extrusion, feed) for point, extrusion, feed in zip(points, extrusions, feeds)]))
+
+
+def extrusion_profile(start: float, per_segment: float, steps: int) -> List[float]:
+    """Calculate the extrusion value at the end of every sub-segment of a move.
+
+    Every value is calculated from the start of the move, so the rounding errors do not
+    accumulate along long moves.
+
+    Args:
+        start (float): extrusion value at the start of the move
+        per_segment (float): extrusion of a sub-segment
+        steps (int): number of sub-segments
+
+    Returns:
+        List[float]: the extrusion values
+    """
+    return [start + per_segment * step for step in range(1, steps + 1)]
+
+
+def speed_profile(near: List[bool], segment_steps: float, division_nr: float, speed_deficit: float, current_speed: float,
+                  max_speed_factor: float, min_speed_factor: float, variable_speed: bool) -> List[float]:
+    """Calculate the speed of every sub-segment of a move.
+
+    Without variable speed a sub-segment near the walls keeps the infill speed and the others
+    are slowed down by the minimum factor. With variable speed the move accelerates from the
+    minimum speed over the first ``division_nr`` sub-segments, runs at the maximum speed and
+    decelerates over the last ``division_nr`` sub-segments, the distance to the walls is not
+    used then.
+
+    Args:
+        near (List[bool]): whether every sub-segment is nearer to the walls than the variable segment length
+        segment_steps (float): length of the move in sub-segments
+        division_nr (float): number of sub-segments of the acceleration and of the deceleration
+        speed_deficit (float): speed change per sub-segment of the acceleration and of the deceleration
+        current_speed (float): infill speed
+        max_speed_factor (float): factor of the maximum speed
+        min_speed_factor (float): factor of the minimum speed
+        variable_speed (bool): whether the speed follows the gradient
+
+    Returns:
+        List[float]: the speeds
+    """
+    min_speed = current_speed * min_speed_factor
+    if not variable_speed:
+        return [current_speed if is_near else min_speed for is_near in near]
+
+    max_speed = current_speed * max_speed_factor
+    steps = len(near)
+    # first sub-segment at the maximum speed and first sub-segment of the deceleration
+    head = max(0, ceil(division_nr))
+    tail = max(0, ceil(segment_steps - division_nr))
+    accelerating = min(head, tail, steps)
+    cruising = max(0, min(tail, steps) - head)
+    decelerating = max(0, steps - tail)
+
+    return ([min_speed + (speed_deficit * step) for step in range(accelerating)]
+            + [max_speed] * cruising
+            + [max_speed - (speed_deficit * step) for step in range(decelerating)])
+
+
+def far_runs(near: List[bool], speeds: List[Optional[int]]) -> List[int]:
+    """Select the sub-segments kept when the runs far from the walls are merged.
+
+    Consecutive sub-segments far from the walls with the same feedrate lie on the same line
+    with the same extrusion per mm, so a run of them is written as a single move to the end
+    of its last sub-segment. The sub-segments near the walls are all kept, and so is the first
+    one, which starts from the extrusion value of the previous line.
+
+    Args:
+        near (List[bool]): whether every sub-segment is nearer to the walls than the variable segment length
+        speeds (List[Optional[int]]): feedrate of every sub-segment, None when no feedrate is written
+
+    Returns:
+        List[int]: the indices of the sub-segments whose end point is written
+    """
+    kept = []
+    last = len(near) - 1
+    for step in range(len(near)):
+        if 0 < step < last and not near[step] and not near[step + 1] and speeds[step] == speeds[step + 1]:
+            continue
+        kept.append(step)
+
+    return kept
+
+
+def relative_extrusions(extrusions: List[float]) -> List[float]:
+    """Convert the extrusion values of consecutive moves from 0 into relative values.
+
+    The differences are taken between the values rounded to the written 5 decimals, so the
+    written relative values add up to the last value.
+
+    Args:
+        extrusions (List[float]): extrusion values relative to the start of the first move
+
+    Returns:
+        List[float]: the extrusion of every move
+    """
+    rounded = [round(extrusion, 5) for extrusion in extrusions]
+
+    return [end - start for start, end in zip([0.0] + rounded, rounded)]
+
+
+def feed_words(speeds: List[float]) -> List[str]:
+    """Format the feedrate words of consecutive moves.
+
+    The feedrate is modal, a word is only written when the speed changes.
+
+    Args:
+        speeds (List[float]): speed of every move
+
+    Returns:
+        List[str]: the feedrate suffix of every move, e.g. ``" F1800"`` or ``""``
+    """
+    feeds = [int(speed) for speed in speeds]
+
+    return [" F%d" % feed if feed != previous else "" for previous, feed in zip([None] + feeds, feeds)]
+
+
+def arc_length_buckets(lengths: List[float], bucket_length: float) -> List[int]:
+    """Assign the moves of a polyline to the arc length buckets of the gradient.
+
+    A move belongs to the bucket of its midpoint, counted along the polyline from its start.
+
+    Args:
+        lengths (List[float]): length of every move of the polyline
+        bucket_length (float): length of a bucket
+
+    Returns:
+        List[int]: the bucket index of every move
+    """
+    buckets = []
+    travelled = 0.0
+    for length in lengths:
+        buckets.append(int((travelled + length / 2) / bucket_length))
+        travelled += length
+
+    return buckets
+
+
+def bucket_centers(start: Point2D, ends: List[Point2D], lengths: List[float], bucket_length: float, count: int) -> List[Point2D]:
+    """Calculate the points of a polyline in the middle of its first arc length buckets.
+
+    Args:
+        start (Point2D): start of the polyline
+        ends (List[Point2D]): end of every move of the polyline
+        lengths (List[float]): length of every move of the polyline
+        bucket_length (float): length of a bucket
+        count (int): number of buckets
+
+    Returns:
+        List[Point2D]: the center of every bucket
+    """
+    centers = []
+    move = 0
+    begin = start
+    travelled = 0.0
+    for bucket in range(count):
+        target = (bucket + 0.5) * bucket_length
+        while move < len(lengths) - 1 and travelled + lengths[move] < target:
+            travelled += lengths[move]
+            begin = ends[move]
+            move += 1
+        end = ends[move]
+        ratio = (target - travelled) / lengths[move] if lengths[move] > 0 else 0.0
+        centers.append(Point2D(begin.x + (end.x - begin.x) * ratio, begin.y + (end.y - begin.y) * ratio))
+
+    return centers
+
+
 def is_layer(line: str) -> bool:
     """Check if current line is the start of a layer section.
 
@@ -189,16 +1216,138 @@ def is_outerwall(line: str) -> bool:
     return line.startswith(";TYPE:WALL-OUTER")
 
 
-def ez_nyomtatasi_vonal(line: str) -> bool:
+def ez_nyomtatasi_vonal(line: GcodeLine) -> bool:
     """Check if current line is a standard printing segment.
 
     Args:
-        line (str): Gcode line
+        line (GcodeLine): parsed Gcode line
 
     Returns:
         bool: True if the line is a standard printing segment
     """
-    return "G1" in line and " X" in line and "Y" in line and "E" in line
+    return line.command == "G1" and line.x is not None and line.y is not None and line.e is not None
+
+
+def is_move(line: GcodeLine) -> bool:
+    """Check if current line moves the head to a new XY position.
+
+    Args:
+        line (GcodeLine): parsed Gcode line
+
+    Returns:
+        bool: True if the line is a G0 or G1 move with X and Y coordinates
+    """
+    return (line.command == "G1" or line.command == "G0") and line.x is not None and line.y is not None
+
+
+def is_arc(line: GcodeLine) -> bool:
+    """Check if current line is a G2/G3 arc.
+
+    Args:
+        line (GcodeLine): parsed Gcode line
+
+    Returns:
+        bool: True if the line is a clockwise or counter-clockwise arc
+    """
+    return line.command == "G2" or line.command == "G3"
+
+
+def arc_end(line: GcodeLine, start: Point2D) -> Point2D:
+    """Get the end point of an arc, the missing coordinates do not change.
+
+    Args:
+        line (GcodeLine): parsed G2/G3 line
+        start (Point2D): position before the arc
+
+    Returns:
+        Point2D: the end point
+    """
+    return Point2D(start.x if line.x is None else line.x, start.y if line.y is None else line.y)
+
+
+def arc_points(line: GcodeLine, start: Point2D, tolerance: float = ARC_TOLERANCE) -> List[Point2D]:
+    """Linearize an arc into chords.
+
+    The center is given by the ``I``/``J`` offset from the start or by the ``R`` radius, a
+    negative radius selects the arc longer than a half circle. An arc ending at its start is a
+    full circle. The chords deviate at most ``tolerance`` from the arc.
+
+    Args:
+        line (GcodeLine): parsed G2/G3 line
+        start (Point2D): position before the arc
+        tolerance (float): maximum distance between the chords and the arc
+
+    Returns:
+        List[Point2D]: the end points of the chords, the last one is the end of the arc
+    """
+    end = arc_end(line, start)
+    clockwise = line.command == "G2"
+    if line.i is not None or line.j is not None:
+        cx = start.x + (line.i or 0.0)
+        cy = start.y + (line.j or 0.0)
+    elif line.r:
+        dx = end.x - start.x
+        dy = end.y - start.y
+        chord = (dx * dx + dy * dy) ** 0.5
+        if chord == 0:
+            return [end]
+        # the center is on the bisector of the chord
+        height = max(line.r * line.r - chord * chord / 4, 0.0) ** 0.5
+        side = -1 if clockwise != (line.r < 0) else 1
+        cx = (start.x + end.x) / 2 - side * height * dy / chord
+        cy = (start.y + end.y) / 2 + side * height * dx / chord
+    else:
+        return [end]
+
+    radius = ((start.x - cx) ** 2 + (start.y - cy) ** 2) ** 0.5
+    if radius == 0:
+        return [end]
+    angle = atan2(start.y - cy, start.x - cx)
+    sweep = atan2(end.y - cy, end.x - cx) - angle
+    if clockwise and sweep >= 0:
+        sweep -= 2 * pi
+    elif not clockwise and sweep <= 0:
+        sweep += 2 * pi
+    step = 2 * acos(1 - tolerance / radius) if tolerance < radius else pi / 2
+    chords = max(1, ceil(abs(sweep) / step))
+
+    return [Point2D(cx + radius * cos(angle + sweep * k / chords), cy + radius * sin(angle + sweep * k / chords)) for k in range(1, chords)] + [end]
+
+
+# Commands changing the extrusion mode, the extrusion is relative after M83 or G91
+EXTRUSION_MODE_COMMANDS = frozenset(("M82", "M83", "G90", "G91"))
+# Commands whose E parameter is an extrusion
+EXTRUDING_COMMANDS = frozenset(("G0", "G1", "G2", "G3"))
+
+
+def track_extrusion(line: GcodeLine, extrusion: float, relative_extrusion: bool, relative_positioning: bool) -> Tuple[float, bool, bool]:
+    """Follow the extrusion value and the extrusion mode through a gcode line.
+
+    ``M83``/``M82`` switch the extruder to relative/absolute values; ``G91``/``G90`` switch
+    all axes, so the extrusion is relative if either of them says so. ``G92`` sets the value.
+
+    Args:
+        line (GcodeLine): parsed Gcode line
+        extrusion (float): extrusion value before the line, absolute
+        relative_extrusion (bool): M83 is active
+        relative_positioning (bool): G91 is active
+
+    Returns:
+        Tuple[float, bool, bool]: the extrusion value, M83 and G91 modes after the line
+    """
+    command = line.command
+    if command in EXTRUSION_MODE_COMMANDS:
+        if command == "M83" or command == "M82":
+            relative_extrusion = command == "M83"
+        else:
+            relative_positioning = command == "G91"
+    elif line.e is not None:
+        if command == "G92":
+            extrusion = line.e
+        elif command in EXTRUDING_COMMANDS:
+            extrusion = extrusion + line.e if relative_extrusion or relative_positioning else line.e
+
+    return extrusion, relative_extrusion, relative_positioning
 
 
 def is_infill(line: str) -> bool:
@@ -217,6 +1366,7 @@ def fill_type(Mode):
     """Definie the type of Infill pattern
 
        Linearly Variable Infill like lineas or triangles = 1
+       Polyline Infill like gyroid or concentric = 2
 
     Args:
         line (Mode): Infill Pattern
@@ -236,24 +1386,1178 @@ def fill_type(Mode):
     if Mode == 'cubic':
         iMode=1
     if Mode == 'cubicsubdiv':
-        iMode=0
+        iMode=2
     if Mode == 'tetrahedral':
         iMode=1
     if Mode == 'quarter_cubic':
         iMode=1
     if Mode == 'concentric':
-        iMode=0
+        iMode=2
     if Mode == 'zigzag':
-        iMode=0
+        iMode=2
     if Mode == 'cross':
-        iMode=0
+        iMode=2
     if Mode == 'cross_3d':
-        iMode=0
+        iMode=2
     if Mode == 'gyroid':
-        iMode=0
+        iMode=2
 
     return iMode
+
+
+def pattern_type(infill_pattern: str, connect_infill: bool) -> int:
+    """Define the type of processing of the infill from the extruder settings.
+
+    The connected infill lines are chains of moves along the walls, they are processed like
+    the curved patterns.
+
+    Args:
+        infill_pattern (str): infill_pattern setting of the extruder
+        connect_infill (bool): zig_zaggify_infill setting of the extruder
+
+    Returns:
+        int: the ``Infill`` value, 0 when the pattern is not supported
+    """
+    infill_type = fill_type(infill_pattern)
+    if infill_type != 0 and connect_infill:
+        return Infill.POLYLINE.value
+
+    return infill_type
         
+InfillSettings = namedtuple('InfillSettings', 'variable_segment_length division_nr variable_speed max_speed_factor min_speed_factor infill_type distance_field_resolution perimeter_cache_bytes adaptive_subdivision debug_lines')
+# the optional settings default to the exact behaviour
+InfillSettings.__new__.__defaults__ = (0.0, PERIMETER_CACHE_BYTES, False, False)
+CarriedState = namedtuple('CarriedState', 'section last_position current_speed last_extrusion relative_extrusion relative_positioning')
+# absolute extrusion from 0 until the gcode sets the mode
+CarriedState.__new__.__defaults__ = (0.0, False, False)
+
+# State at the start of the gcode
+INITIAL_STATE = CarriedState(Section.NOTHING, Point2D(-10000, -10000), None)
+
+
+def iter_lines(stream: TextIO) -> Iterator[str]:
+    """Read the gcode lines of a text stream one by one.
+
+    The lines are split the same way as ``str.split("\\n")`` splits a whole layer, so a
+    trailing newline yields a last empty line.
+
+    Args:
+        stream (TextIO): gcode text stream opened with ``newline="\\n"``
+
+    Yields:
+        str: gcode line without the line terminator
+    """
+    line = ""
+    for line in stream:
+        if line.endswith("\n"):
+            yield line[:-1]
+            line = ""
+    yield line
+
+
+def write_lines(lines: Iterable[str], sink: TextIO) -> None:
+    """Write gcode lines to a text stream the same way as ``"\\n".join`` joins them.
+
+    Args:
+        lines (Iterable[str]): gcode lines to write
+        sink (TextIO): text stream opened with ``newline="\\n"``
+    """
+    separator = ""
+    for line in lines:
+        sink.write(separator)
+        sink.write(line)
+        separator = "\n"
+
+
+class Profiler:
+    """Opt-in counters and timers of the processing phases.
+
+    The phases are the parsing of the lines (``parse``), the indexing of the perimeter
+    (``perimeter``), the distance queries (``distance``), the emission of the sub-segments
+    (``emission``) and the joining of the output (``assembly``). ``end_layer`` closes the
+    summary of a layer, ``report`` formats the totals and the slowest layers.
+    """
+
+    PHASES = ('parse', 'perimeter', 'distance', 'emission', 'assembly')
+
+    def __init__(self):
+        """Create a profiler with empty counters."""
+        self.totals = dict.fromkeys(self.PHASES, 0.0)  # type: Dict[str, float]
+        self.counters = {}  # type: Dict[str, int]
+        self.layers = []  # type: List[Tuple[str, int, float, Dict[str, float]]]
+        self.elapsed = 0.0
+        self.layer_totals = dict(self.totals)
+        self.layer_start = perf_counter()
+
+    def add(self, phase: str, seconds: float) -> None:
+        """Add the time spent in a phase.
+
+        Args:
+            phase (str): one of ``PHASES``
+            seconds (float): time spent
+        """
+        self.totals[phase] += seconds
+
+    def count(self, counter: str, number: int = 1) -> None:
+        """Increment a counter.
+
+        Args:
+            counter (str): name of the counter
+            number (int): increment
+        """
+        self.counters[counter] = self.counters.get(counter, 0) + number
+
+    def start_layer(self) -> None:
+        """Start the wall clock of the next layer."""
+        self.layer_start = perf_counter()
+
+    def end_layer(self, name: str, lines: int) -> None:
+        """Close the summary of a layer.
+
+        Args:
+            name (str): name of the layer, the ``;LAYER:`` line
+            lines (int): number of input lines of the layer
+        """
+        elapsed = perf_counter() - self.layer_start
+        phases = {phase: self.totals[phase] - self.layer_totals[phase] for phase in self.PHASES}
+        self.layers.append((name, lines, elapsed, phases))
+        self.layer_totals = dict(self.totals)
+        self.elapsed += elapsed
+        self.layer_start = perf_counter()
+
+    def merge(self, other: 'Profiler') -> None:
+        """Add the counters and layer summaries of another profiler, e.g. of a worker process.
+
+        Args:
+            other (Profiler): profiler to merge
+        """
+        for phase, seconds in other.totals.items():
+            self.add(phase, seconds)
+        for counter, number in other.counters.items():
+            self.count(counter, number)
+        self.layers.extend(other.layers)
+        self.elapsed += other.elapsed
+
+    def report(self, slowest: int = 5) -> str:
+        """Format the report.
+
+        Args:
+            slowest (int): number of the slowest layers listed
+
+        Returns:
+            str: the report
+        """
+        lines = ['Linearly Variable Infill profile : {} layers in {:.3f} s'.format(len(self.layers), self.elapsed)]
+        other = self.elapsed - sum(self.totals.values())
+        for phase, seconds in list(self.totals.items()) + [('other', other)]:
+            share = 100 * seconds / self.elapsed if self.elapsed else 0.0
+            lines.append('  {:<10} {:9.3f} s {:5.1f} %'.format(phase, seconds, share))
+        for counter in sorted(self.counters):
+            lines.append('  {:<24} {}'.format(counter, self.counters[counter]))
+        if self.layers and slowest:
+            lines.append('Slowest layers :')
+            for name, line_count, elapsed, phases in sorted(self.layers, key=lambda layer: layer[2], reverse=True)[:slowest]:
+                details = ' '.join('{} {:.3f}'.format(phase, seconds) for phase, seconds in phases.items() if seconds)
+                lines.append('  {} : {} lines {:.3f} s ({})'.format(name, line_count, elapsed, details))
+
+        return "\n".join(lines)
+
+
+class SectionTracker:
+    """State machine following the section type of the gcode lines.
+
+    The section is carried across layers, so the same tracker has to be used for the whole gcode.
+    """
+
+    def __init__(self, section: Section = Section.NOTHING):
+        self.section = section
+
+    def track(self, lines: Iterable[GcodeLine]) -> Iterator[Tuple[Section, GcodeLine]]:
+        """Attach the section type to the gcode lines.
+
+        Args:
+            lines (Iterable[GcodeLine]): parsed gcode lines, see ``tokenize``
+
+        Yields:
+            Tuple[Section, GcodeLine]: the section the line belongs to and the line itself
+        """
+        for line in lines:
+            # section markers are comments, other lines cannot change the section
+            if line.comment is not None:
+                text = line.text
+                if is_innerwall(text):
+                    self.section = Section.INNER_WALL
+                elif is_outerwall(text):
+                    self.section = Section.OUTER_WALL
+                elif is_infill(text):
+                    self.section = Section.INFILL
+                    yield self.section, line
+                    continue
+                #
+                # comment like ;MESH:NONMESH closes the infill
+                #
+                if self.section == Section.INFILL:
+                    self.section = Section.NOTHING
+                    yield Section.INFILL, line
+                    continue
+            yield self.section, line
+
+
+class InfillRewriter:
+    """Rewrite the infill moves of the gcode with the variable speed gradient.
+
+    The rewriter collects the inner walls of every layer as perimeter and carries the last
+    position and the infill speed across layers, so the same rewriter has to be used for the
+    whole gcode.
+    """
+
+    def __init__(self, settings: InfillSettings, state: CarriedState = INITIAL_STATE, profiler: Optional[Profiler] = None):
+        """Create a rewriter.
+
+        Args:
+            settings (InfillSettings): the script settings
+            state (CarriedState): the state carried over from the previous layers
+            profiler (Optional[Profiler]): collects the phase timings and counters when given
+        """
+        self.settings = settings
+        self.profiler = profiler
+        self.lastPosition = state.last_position
+        self.current_speed = state.current_speed
+        self.lastExtrusion = state.last_extrusion
+        self.relativeExtrusion = state.relative_extrusion
+        self.relativePositioning = state.relative_positioning
+        self.perimeterSegments = PerimeterStore()
+        self.perimeterGrid = PerimeterGrid(self.perimeterSegments, settings.variable_segment_length)
+        # source of the distance queries of the current infill, the grid or a distance field
+        self.perimeterDistance = self.perimeterGrid
+        # perimeters of previous layers, and whether the current one is shared with the cache
+        self.perimeterCache = PerimeterCache(settings.perimeter_cache_bytes)
+        self.perimeterShared = False
+        # the wall distances only change the output when the far sub-segments are merged, or for
+        # the polyline infill speed without the variable speed
+        self.measuresDistances = settings.adaptive_subdivision or (settings.infill_type == Infill.POLYLINE.value and not settings.variable_speed)
+        # moves of the polyline infill not written yet, per input line, and its infill speed
+        self.polyline = []
+        self.polylineSpeed = None
+
+    def carried(self, section: Section) -> CarriedState:
+        """Get the state carried over to the next layer.
+
+        Args:
+            section (Section): the section at the end of the layer, see ``SectionTracker``
+
+        Returns:
+            CarriedState: the state
+        """
+        return CarriedState(section, self.lastPosition, self.current_speed, self.lastExtrusion, self.relativeExtrusion, self.relativePositioning)
+
+    def resume(self, state: CarriedState) -> None:
+        """Continue after layers that were not rewritten by this rewriter, e.g. taken from a ``LayerCache``.
+
+        Args:
+            state (CarriedState): the state at the end of those layers
+        """
+        self.lastPosition = state.last_position
+        self.current_speed = state.current_speed
+        self.lastExtrusion = state.last_extrusion
+        self.relativeExtrusion = state.relative_extrusion
+        self.relativePositioning = state.relative_positioning
+
+    def distance_source(self):
+        """Select the source of the distance queries for the infill that starts.
+
+        The perimeter is looked up in the cache first; a layer with the same inner walls as a
+        cached one reuses its grid and distance field, otherwise the grid is indexed and cached.
+        Nothing is indexed when the distances do not change the output.
+
+        Returns:
+            PerimeterGrid or DistanceField: the exact grid, or the distance field when the approximate mode is enabled
+        """
+        if len(self.perimeterSegments) == 0 or not self.measuresDistances:
+            return self.perimeterGrid
+        key = perimeter_key(self.perimeterSegments)
+        entry = self.perimeterCache.get(key)
+        if entry is None:
+            self.perimeterGrid.sync()
+            entry = CachedPerimeter(self.perimeterSegments, self.perimeterGrid)
+            self.perimeterCache.put(key, entry)
+        self.perimeterSegments = entry.segments
+        self.perimeterGrid = entry.grid
+        self.perimeterShared = True
+
+        resolution = self.settings.distance_field_resolution
+        if not resolution or load_numpy() is None:
+            return self.perimeterGrid
+        if entry.field is None:
+            entry.field = DistanceField(self.perimeterGrid, resolution, self.settings.variable_segment_length)
+            self.perimeterCache.put(key, entry)
+
+        return entry.field
+
+    def rewrite(self, tracked: Iterable[Tuple[Section, GcodeLine]]) -> Iterator[str]:
+        """Rewrite the infill moves.
+
+        G2/G3 arcs of the infill are linearized into chords rewritten like straight moves, the
+        lines of the other sections are passed through unchanged. The polyline infill keeps its
+        moves; consecutive extruding moves are collected and written by ``flush_polyline``.
+
+        Args:
+            tracked (Iterable[Tuple[Section, GcodeLine]]): parsed gcode lines with their section, see ``SectionTracker.track``
+
+        Yields:
+            str: the output for every input line, a rewritten move spans several lines
+        """
+        variable_segment_lengh = self.settings.variable_segment_length
+        infill_type = self.settings.infill_type
+        debug_lines = self.settings.debug_lines
+        profiler = self.profiler
+
+        for currentSection, line in tracked:
+            currentLineINcode = line.text
+            new_Line = []
+            outputLine = currentLineINcode
+            is_comment = line.comment is not None
+            polylineMoves = None
+
+            if is_comment and is_layer(currentLineINcode):
+                self.perimeterSegments = PerimeterStore()
+                self.perimeterGrid = PerimeterGrid(self.perimeterSegments, variable_segment_lengh)
+                self.perimeterDistance = self.perimeterGrid
+                self.perimeterShared = False
+
+            if currentSection == Section.INNER_WALL:
+                if ez_nyomtatasi_vonal(line):
+                    if debug_lines:
+                        Logger.log('d', 'Ez sor rossz ' + currentLineINcode)
+                    self.add_perimeter(Segment(Point2D(line.x, line.y), self.lastPosition))
+                elif is_arc(line) and line.e is not None:
+                    start = self.lastPosition
+                    for point in arc_points(line, start):
+                        self.add_perimeter(Segment(point, start))
+                        start = point
+
+            if is_comment and is_infill(currentLineINcode):
+                # Log Size of perimeterSegments for debuging
+                if debug_lines:
+                    Logger.log('d', 'PerimeterSegments seg : {}'.format(len(self.perimeterSegments)))
+                # The inner walls of the layer are complete, index them for the distance queries
+                if profiler is None:
+                    self.perimeterDistance = self.distance_source()
+                else:
+                    start = perf_counter()
+                    self.perimeterDistance = self.distance_source()
+                    profiler.add('perimeter', perf_counter() - start)
+                    profiler.count('infill sections')
+                    profiler.count('perimeter segments', len(self.perimeterSegments))
+                if self.polyline:
+                    yield from self.flush_polyline()
+                # ! Important
+                yield outputLine
+                continue
+
+            if currentSection == Section.INFILL and infill_type == Infill.POLYLINE.value and not is_comment:
+                # the moves of the polyline are written when it ends, with the speed along its whole length
+                if ez_nyomtatasi_vonal(line):
+                    polylineMoves = [(currentLineINcode, self.lastPosition, Point2D(line.x, line.y))]
+                elif is_arc(line) and line.e is not None:
+                    polylineMoves = [(gcode_template(end.x, end.y, E_inCode), start, end) for start, end, E_inCode in self.arc_chords(line)]
+                    if line.f is not None:
+                        # the feedrate of the arc, kept when the polyline is written unchanged
+                        text, start, end = polylineMoves[0]
+                        polylineMoves[0] = ("{} F{}".format(text, line.f), start, end)
+                if polylineMoves is not None and line.f is not None:
+                    if self.polyline:
+                        yield from self.flush_polyline()
+                    self.current_speed = line.f
+                elif line.f is not None and (line.command == "G1" or is_arc(line)):
+                    self.current_speed = line.f
+
+            elif currentSection == Section.INFILL:
+                if line.f is not None and (line.command == "G1" or is_arc(line)):
+                    self.current_speed = line.f
+                    new_Line.append("G1 F{}\n".format(self.current_speed))
+
+                if ez_nyomtatasi_vonal(line):
+                    if profiler is not None:
+                        profiler.count('infill moves')
+                    E_inCode = line.e
+
+                    # ha lineraris
+                    if infill_type == Infill.LINEAR.value:
+                        moveLines = self.rewrite_move(self.lastPosition, Point2D(line.x, line.y), E_inCode, self.relativeExtrusion or self.relativePositioning)
+                        if moveLines is not None:
+                            new_Line.append(moveLines)
+                            outputLine = "".join(new_Line)
+                        else:
+                            outPutLine = []
+                            for element in currentLineINcode.split(" "):
+                                if "E" in element:
+                                    outPutLine.append("E" + str(round(E_inCode, 5)))
+                                else:
+                                    outPutLine.append(element + " ")
+                            outputLine = "".join(outPutLine)
+
+                elif is_arc(line) and line.e is not None and infill_type == Infill.LINEAR.value:
+                    if profiler is not None:
+                        profiler.count('infill arcs')
+                    new_Line.append(self.rewrite_arc(line))
+                    outputLine = "".join(new_Line)
+
+                #
+                # comment like ;MESH:NONMESH
+                #
+                if is_comment:
+                    outputLine = currentLineINcode # other Comment
+            #
+            # line with move
+            #
+            if is_move(line):
+                self.lastPosition = Point2D(line.x, line.y)
+            elif is_arc(line):
+                self.lastPosition = arc_end(line, self.lastPosition)
+            if line.e is not None or line.command in EXTRUSION_MODE_COMMANDS:
+                self.lastExtrusion, self.relativeExtrusion, self.relativePositioning = track_extrusion(
+                    line, self.lastExtrusion, self.relativeExtrusion, self.relativePositioning)
+
+            if polylineMoves is not None:
+                if not self.polyline:
+                    self.polylineSpeed = self.current_speed
+                self.polyline.append(polylineMoves)
+                continue
+            if self.polyline:
+                yield from self.flush_polyline()
+            yield outputLine
+
+        if self.polyline:
+            yield from self.flush_polyline()
+
+    def add_perimeter(self, segment: Segment) -> None:
+        """Add an inner wall segment to the perimeter of the layer.
+
+        Args:
+            segment (Segment): the wall segment
+        """
+        if self.perimeterShared:
+            # more walls after an infill, the cached perimeter must not change
+            self.perimeterSegments = self.perimeterSegments.copy()
+            self.perimeterGrid = PerimeterGrid(self.perimeterSegments, self.settings.variable_segment_length)
+            self.perimeterShared = False
+        self.perimeterSegments.append(segment)
+
+    def rewrite_move(self, lastPosition: Point2D, currentPosition: Point2D, E_inCode: float, relative: bool) -> Optional[str]:
+        """Subdivide a straight infill move with the speed gradient.
+
+        Args:
+            lastPosition (Point2D): start of the move
+            currentPosition (Point2D): end of the move
+            E_inCode (float): extrusion value at the end of the move, the extruded length with relative extrusion
+            relative (bool): whether the extrusion values are relative
+
+        Returns:
+            Optional[str]: the gcode lines of the sub-segments, None when the move is too short to be subdivided
+        """
+        variable_segment_lengh = self.settings.variable_segment_length
+        division_nr = self.settings.division_nr
+        variable_speed = self.settings.variable_speed
+        max_speed_factor = self.settings.max_speed_factor
+        min_speed_factor = self.settings.min_speed_factor
+        adaptive_subdivision = self.settings.adaptive_subdivision
+        debug_lines = self.settings.debug_lines
+        littleSegmentLength = variable_segment_lengh / division_nr
+        profiler = self.profiler
+        current_speed = self.current_speed
+
+        fullSegmentLength = two_points_distance(lastPosition, currentPosition)
+        segmentSteps = fullSegmentLength / littleSegmentLength
+        if segmentSteps < 2:
+            return None
+        extrudeLengthPERsegment = (0.006584 * fullSegmentLength) / segmentSteps
+        E_inCode_last = E_inCode - (extrudeLengthPERsegment * segmentSteps)
+        littlesegmentDirectionandLength = Point2D((currentPosition.x - lastPosition.x) / fullSegmentLength * littleSegmentLength,(currentPosition.y - lastPosition.y) / fullSegmentLength * littleSegmentLength)
+        speed_deficit = ((current_speed * max_speed_factor + current_speed * min_speed_factor) / division_nr)
+
+        if debug_lines and len(self.perimeterSegments) == 0:
+            Logger.log('d', 'Itt a hiba {} {}'.format(lastPosition, currentPosition))
+        if profiler is not None:
+            emission_start = perf_counter()
+        steps = int(segmentSteps)
+        segmentEnds = [Point2D(lastPosition.x + littlesegmentDirectionandLength.x * step, lastPosition.y + littlesegmentDirectionandLength.y * step) for step in range(1, steps + 1)]
+        if profiler is not None:
+            distance_start = perf_counter()
+        if not adaptive_subdivision:
+            # the speed profile does not use the distances, only the merging of the far sub-segments does
+            midpoints = []
+            near = [True] * steps
+        elif self.perimeterGrid.is_far(lastPosition, currentPosition, variable_segment_lengh):
+            # the whole move is out of the gradient zone, no sub-segment is measured
+            midpoints = []
+            near = [False] * steps
+        else:
+            # distances of all sub-segment midpoints of the move in one line sweep
+            midpoints = [segment_midpoint(Segment(start, end)) for start, end in zip([lastPosition] + segmentEnds, segmentEnds)]
+            shortestDistances = self.perimeterDistance.min_distances_on_line(midpoints, variable_segment_lengh)
+            near = [shortestDistance < variable_segment_lengh for shortestDistance in shortestDistances]
+        if profiler is not None:
+            distance_end = perf_counter()
+        extrusions = extrusion_profile(E_inCode_last, extrudeLengthPERsegment, steps) #szakaszExtrudalas
+        lastSpeed = current_speed * min_speed_factor
+        if variable_speed:
+            segmentSpeeds = speed_profile(near, segmentSteps, division_nr, speed_deficit, current_speed, max_speed_factor, min_speed_factor, variable_speed)
+        else:
+            segmentSpeeds = [None] * steps
+        if adaptive_subdivision:
+            kept = far_runs(near, [None if speed is None else int(speed) for speed in segmentSpeeds])
+            if profiler is not None:
+                profiler.count('merged sub-segments', steps - len(kept))
+            segmentEnds = [segmentEnds[step] for step in kept]
+            extrusions = [extrusions[step] for step in kept]
+            segmentSpeeds = [segmentSpeeds[step] for step in kept]
+        segmentEnds.append(currentPosition) #Original line for finish
+        extrusions.append(E_inCode)
+        if relative:
+            extrusions = relative_extrusions(extrusions)
+        if variable_speed:
+            feeds = feed_words(segmentSpeeds + [lastSpeed])
+        else:
+            feeds = [""] * len(segmentSpeeds) + feed_words([lastSpeed])
+        moveLines = gcode_moves(segmentEnds, extrusions, feeds)
+        if profiler is not None:
+            profiler.add('distance', distance_end - distance_start)
+            profiler.add('emission', perf_counter() - distance_end + distance_start - emission_start)
+            profiler.count('rewritten moves')
+            profiler.count('sub-segments', steps)
+            profiler.count('distance queries', len(midpoints))
+
+        return moveLines
+
+    def arc_chords(self, line: GcodeLine) -> List[Tuple[Point2D, Point2D, float]]:
+        """Linearize an infill arc into chords.
+
+        The extrusion of the arc is distributed over the chords by their length.
+
+        Args:
+            line (GcodeLine): parsed G2/G3 line with extrusion
+
+        Returns:
+            List[Tuple[Point2D, Point2D, float]]: the start, end and extrusion value of every chord
+        """
+        relative = self.relativeExtrusion or self.relativePositioning
+        start = self.lastPosition
+        points = arc_points(line, start)
+        lengths = [two_points_distance(begin, end) for begin, end in zip([start] + points, points)]
+        total = sum(lengths)
+        # extrusion values at the chord ends, counted from 0 at the start of a relative arc
+        base = 0.0 if relative else self.lastExtrusion
+        extruded = line.e - base
+        cumulative = 0.0
+        ends = []
+        for length in lengths[:-1]:
+            cumulative += length
+            ends.append(base + round(extruded * cumulative / total, 5))
+        ends.append(line.e)
+
+        chords = []
+        chordStart = base
+        for point, chordEnd in zip(points, ends):
+            chords.append((start, point, chordEnd - chordStart if relative else chordEnd))
+            start = point
+            chordStart = chordEnd
+
+        return chords
+
+    def rewrite_arc(self, line: GcodeLine) -> str:
+        """Linearize an infill arc and subdivide its chords like straight moves.
+
+        Args:
+            line (GcodeLine): parsed G2/G3 line with extrusion
+
+        Returns:
+            str: the gcode lines of the chords
+        """
+        relative = self.relativeExtrusion or self.relativePositioning
+        chordLines = []
+        for start, point, E_inCode in self.arc_chords(line):
+            moveLines = self.rewrite_move(start, point, E_inCode, relative)
+            if moveLines is None:
+                moveLines = gcode_template(point.x, point.y, E_inCode) + "\n"
+            chordLines.append(moveLines)
+
+        return "".join(chordLines)
+
+    def flush_polyline(self) -> Iterator[str]:
+        """Write the moves of the polyline infill collected since its start.
+
+        The polyline is divided into buckets of the sub-segment length along its arc length and
+        every move gets the speed of the bucket of its midpoint, from the same profile as the
+        sub-segments of a straight move; the moves past the last whole bucket finish at the
+        minimum speed. Only the feedrate words change, the geometry and the extrusion are kept.
+        The wall distances are measured once per bucket, so the work is linear in the length of
+        the polyline and not in its number of moves.
+
+        Yields:
+            str: the output of every collected input line
+        """
+        collected = self.polyline
+        self.polyline = []
+        moves = [move for lineMoves in collected for move in lineMoves]
+        current_speed = self.polylineSpeed
+        variable_segment_lengh = self.settings.variable_segment_length
+        division_nr = self.settings.division_nr
+        min_speed_factor = self.settings.min_speed_factor
+        littleSegmentLength = variable_segment_lengh / division_nr
+        profiler = self.profiler
+
+        lengths = [two_points_distance(start, end) for _, start, end in moves]
+        segmentSteps = sum(lengths) / littleSegmentLength
+        if current_speed is None or segmentSteps < 2:
+            for lineMoves in collected:
+                yield "\n".join(text for text, _, _ in lineMoves)
+            return
+
+        if profiler is not None:
+            emission_start = perf_counter()
+        steps = int(segmentSteps)
+        speed_deficit = ((current_speed * self.settings.max_speed_factor + current_speed * min_speed_factor) / division_nr)
+        if self.settings.variable_speed:
+            # the speed follows the arc length only
+            near = [True] * steps
+            distance_time = 0.0
+        else:
+            distance_start = perf_counter()
+            centers = bucket_centers(moves[0][1], [end for _, _, end in moves], lengths, littleSegmentLength, steps)
+            near = [distance < variable_segment_lengh for distance in self.perimeterDistance.min_distances(centers, variable_segment_lengh)]
+            distance_time = perf_counter() - distance_start
+        bucketSpeeds = speed_profile(near, segmentSteps, division_nr, speed_deficit, current_speed,
+                                     self.settings.max_speed_factor, min_speed_factor, self.settings.variable_speed)
+        bucketSpeeds.append(current_speed * min_speed_factor)
+        feeds = iter(feed_words([bucketSpeeds[min(bucket, steps)] for bucket in arc_length_buckets(lengths, littleSegmentLength)]))
+        outputLines = ["\n".join(FEED_WORD.sub("", text).rstrip() + next(feeds) for text, _, _ in lineMoves) for lineMoves in collected]
+        if profiler is not None:
+            profiler.add('distance', distance_time)
+            profiler.add('emission', perf_counter() - emission_start - distance_time)
+            profiler.count('rewritten polylines')
+            profiler.count('polyline moves', len(moves))
+            profiler.count('distance queries', 0 if self.settings.variable_speed else steps)
+
+        yield from outputLines
+
+
+@lru_cache(maxsize=None)
+def source_digest() -> bytes:
+    """Hash the source of this script once.
+
+    Any change of the script may change the rewritten layers, the digest keeps the
+    ``LayerCache`` entries written by another revision from being used.
+
+    Returns:
+        bytes: digest of the script file
+    """
+    import hashlib
+    with open(__file__, "rb") as source:
+        return hashlib.blake2b(source.read(), digest_size=16).digest()
+
+
+def layer_key(layer: str, settings: InfillSettings, state: CarriedState) -> str:
+    """Calculate the key of a rewritten layer in the ``LayerCache``.
+
+    The output of a layer depends on its text, the settings, the state carried over from
+    the previous layers and the script, see ``source_digest``; the size of the perimeter
+    cache and the debug logging do not change the output.
+
+    Args:
+        layer (str): the text of the layer
+        settings (InfillSettings): the script settings
+        state (CarriedState): the state at the start of the layer
+
+    Returns:
+        str: hexadecimal digest
+    """
+    import hashlib
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(source_digest())
+    digest.update(repr((__version__, tuple(settings._replace(perimeter_cache_bytes=0, debug_lines=False)), state.section.value) + tuple(state[1:])).encode("utf-8"))
+    digest.update(layer.encode("utf-8"))
+
+    return digest.hexdigest()
+
+
+class LayerCache:
+    """On-disk cache of rewritten layers keyed by ``layer_key``.
+
+    Cura runs the post-processing again on every save, the layers rewritten before are read
+    back from the cache and only the changed layers are rewritten. Every entry is a file
+    holding the state at the end of the layer and the rewritten text. The cache is bounded by
+    the size of its files: the least recently used entries, by modification time, are removed
+    until the cache is below 90 % of ``max_bytes``.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = LAYER_CACHE_BYTES):
+        """Open the cache, the directory is created if needed.
+
+        Args:
+            directory (str): directory of the cache files
+            max_bytes (int): size bound of the cache files
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(size for _, size, _ in self.entries())
+
+    def path(self, key: str) -> str:
+        """Get the file of an entry, the entries are spread over subdirectories by their first characters."""
+        return os.path.join(self.directory, key[:2], key + ".gcode")
+
+    def entries(self) -> List[Tuple[float, int, str]]:
+        """List the cache files.
+
+        Returns:
+            List[Tuple[float, int, str]]: the modification time, size and path of every file
+        """
+        found = []
+        for folder in os.scandir(self.directory):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                found.append((stat.st_mtime, stat.st_size, entry.path))
+
+        return found
+
+    def get(self, key: str) -> Optional[Tuple[str, CarriedState]]:
+        """Look up a rewritten layer.
+
+        Args:
+            key (str): key of the layer
+
+        Returns:
+            Optional[Tuple[str, CarriedState]]: the rewritten layer and the state at its end, None if it is not cached
+        """
+        import json
+        path = self.path(key)
+        try:
+            with open(path, "r", encoding="utf-8", newline="\n") as entry:
+                header = entry.readline()
+                text = entry.read()
+            section, x, y, current_speed, last_extrusion, relative_extrusion, relative_positioning = json.loads(header)
+            # the entry is used again, keep it from the eviction
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+
+        return text, CarriedState(Section(section), Point2D(x, y), current_speed, last_extrusion, relative_extrusion, relative_positioning)
+
+    def put(self, key: str, text: str, state: CarriedState) -> None:
+        """Store a rewritten layer.
+
+        The file is written under a temporary name and renamed, so a concurrent reader never
+        sees a partial entry.
+
+        Args:
+            key (str): key of the layer
+            text (str): the rewritten layer
+            state (CarriedState): the state at the end of the layer
+        """
+        import json
+        path = self.path(key)
+        header = json.dumps([state.section.value, state.last_position.x, state.last_position.y, state.current_speed,
+                             state.last_extrusion, state.relative_extrusion, state.relative_positioning])
+        temporary = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temporary, "w", encoding="utf-8", newline="\n") as entry:
+                entry.write(header)
+                entry.write("\n")
+                entry.write(text)
+            os.replace(temporary, path)
+        except OSError as error:
+            # the cache is only an optimization, a full disk must not stop the post-processing
+            Logger.log('w', 'Layer cache entry not written : {}'.format(error))
+            return
+        self.size += len(header) + 1 + len(text.encode("utf-8"))
+        if self.size > self.max_bytes:
+            self.trim()
+
+    def trim(self) -> None:
+        """Remove the least recently used entries until the cache is below 90 % of its bound."""
+        entries = sorted(self.entries())
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+            self.evictions += 1
+
+    def stats(self) -> str:
+        """Describe the counters for the log."""
+        return 'Layer cache : {} hits / {} misses / {} evictions / {} bytes'.format(self.hits, self.misses, self.evictions, self.size)
+
+
+def read_layers(stream: TextIO) -> Iterator[str]:
+    """Split a gcode stream into layers the same way Cura passes them to ``Script.execute``.
+
+    Every ``;LAYER:`` line starts a new layer, the lines before the first layer form the
+    first element. Joining the layers gives back the stream content.
+
+    Args:
+        stream (TextIO): gcode text stream opened with ``newline="\\n"``
+
+    Yields:
+        str: the text of a layer
+    """
+    layer = []
+    for line in stream:
+        if is_layer(line) and layer:
+            yield "".join(layer)
+            layer = []
+        layer.append(line)
+    if layer:
+        yield "".join(layer)
+
+
+def layer_offsets(buffer) -> List[int]:
+    """Find the byte offsets where the layers of a gcode buffer start.
+
+    The layers are split the same way as ``read_layers``; the first offset is 0 unless the
+    buffer is empty.
+
+    Args:
+        buffer (bytes or mmap.mmap): the gcode file content
+
+    Returns:
+        List[int]: the start offset of every layer
+    """
+    if not len(buffer):
+        return []
+    offsets = [0]
+    position = buffer.find(b"\n;LAYER:")
+    while position >= 0:
+        offsets.append(position + 1)
+        position = buffer.find(b"\n;LAYER:", position + 1)
+
+    return offsets
+
+
+class LayerIndex:
+    """Layers of a gcode file located by their byte offsets in a memory map of the file.
+
+    Only the layer that is processed is decoded into a string, so multi-GB files can be
+    processed without reading them into memory. Iterating gives the same layers as
+    ``read_layers``; ``ranges`` gives the byte range of every layer, which is what the parallel
+    processing sends to the worker processes.
+    """
+
+    def __init__(self, path: str):
+        """Map a gcode file and index its layers.
+
+        Args:
+            path (str): gcode file
+        """
+        self.path = path
+        self.file = open(path, "rb")
+        # an empty file can not be mapped
+        if os.fstat(self.file.fileno()).st_size:
+            self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.buffer = b""
+        self.offsets = layer_offsets(self.buffer)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, index: int) -> str:
+        index = range(len(self.offsets))[index]
+        start = self.offsets[index]
+        end = self.offsets[index + 1] if index + 1 < len(self.offsets) else len(self.buffer)
+        return read_range(self.buffer, start, end)
+
+    def __iter__(self) -> Iterator[str]:
+        for start, end in self.ranges():
+            yield read_range(self.buffer, start, end)
+
+    def ranges(self) -> List[Tuple[int, int]]:
+        """Give the byte range of every layer.
+
+        Returns:
+            List[Tuple[int, int]]: the start and end offset of every layer
+        """
+        return list(zip(self.offsets, self.offsets[1:] + [len(self.buffer)]))
+
+    def close(self) -> None:
+        """Unmap and close the file."""
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+        self.file.close()
+
+    def __enter__(self) -> 'LayerIndex':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def read_range(buffer, start: int, end: int) -> str:
+    """Decode a layer of a gcode buffer.
+
+    Args:
+        buffer (bytes or mmap.mmap): the gcode file content
+        start (int): start offset of the layer
+        end (int): end offset of the layer
+
+    Returns:
+        str: the text of the layer
+    """
+    return buffer[start:end].decode("utf-8")
+
+
+def rewrite_layers(layers: Iterable[str], settings: InfillSettings, state: CarriedState = INITIAL_STATE, profiler: Optional[Profiler] = None,
+                   cache: Optional[LayerCache] = None) -> Iterator[str]:
+    """Rewrite the infill of the gcode layers one by one.
+
+    Args:
+        layers (Iterable[str]): gcode split into layers, see ``read_layers``
+        settings (InfillSettings): the script settings
+        state (CarriedState): the state at the start of the first layer
+        profiler (Optional[Profiler]): collects the phase timings, counters and layer summaries when given
+        cache (Optional[LayerCache]): the layers rewritten before are taken from this cache and the others are stored in it
+
+    Yields:
+        str: the rewritten layer
+    """
+    tracker = SectionTracker(state.section)
+    rewriter = InfillRewriter(settings, state, profiler)
+    for layer in layers:
+        if cache is not None:
+            key = layer_key(layer, settings, rewriter.carried(tracker.section))
+            cached = cache.get(key)
+            if cached is not None:
+                text, state = cached
+                rewriter.resume(state)
+                tracker.section = state.section
+                yield text
+                continue
+
+        if profiler is None:
+            text = "\n".join(rewriter.rewrite(tracker.track(tokenize(layer.split("\n")))))
+        else:
+            profiler.start_layer()
+            start = perf_counter()
+            records = list(tokenize(layer.split("\n")))
+            profiler.add('parse', perf_counter() - start)
+            output = list(rewriter.rewrite(tracker.track(records)))
+            start = perf_counter()
+            text = "\n".join(output)
+            profiler.add('assembly', perf_counter() - start)
+            profiler.count('lines', len(records))
+            name = next((record.text for record in records if record.comment is not None and is_layer(record.text)), records[0].text)
+            profiler.end_layer(name.strip(), len(records))
+
+        if cache is not None:
+            cache.put(key, text, rewriter.carried(tracker.section))
+        yield text
+    Logger.log('d', rewriter.perimeterCache.stats())
+    if cache is not None:
+        Logger.log('d', cache.stats())
+    if profiler is not None:
+        profiler.count('perimeter cache hits', rewriter.perimeterCache.hits)
+        profiler.count('perimeter cache misses', rewriter.perimeterCache.misses)
+        if cache is not None:
+            profiler.count('layer cache hits', cache.hits)
+            profiler.count('layer cache misses', cache.misses)
+
+
+def carried_state(lines: Iterable[str], state: CarriedState) -> CarriedState:
+    """Follow the state carried across layers without rewriting anything.
+
+    This is the cheap pre-pass of the parallel processing: only the section markers, the
+    infill speed, the last position and the extrusion are followed, the perimeter is not
+    needed because it is reset at every layer.
+
+    Args:
+        lines (Iterable[str]): gcode lines of a layer
+        state (CarriedState): the state at the start of the layer
+
+    Returns:
+        CarriedState: the state at the end of the layer
+    """
+    tracker = SectionTracker(state.section)
+    last_position = state.last_position
+    current_speed = state.current_speed
+    last_extrusion = state.last_extrusion
+    relative_extrusion = state.relative_extrusion
+    relative_positioning = state.relative_positioning
+    for section, line in tracker.track(tokenize(lines)):
+        if section == Section.INFILL and line.f is not None and (line.command == "G1" or is_arc(line)):
+            current_speed = line.f
+        if is_move(line):
+            last_position = Point2D(line.x, line.y)
+        elif is_arc(line):
+            last_position = arc_end(line, last_position)
+        if line.e is not None or line.command in EXTRUSION_MODE_COMMANDS:
+            last_extrusion, relative_extrusion, relative_positioning = track_extrusion(line, last_extrusion, relative_extrusion, relative_positioning)
+
+    return CarriedState(tracker.section, last_position, current_speed, last_extrusion, relative_extrusion, relative_positioning)
+
+
+def _init_worker(level: int) -> None:
+    """Configure the logging of a worker process of ``rewrite_layers_parallel``, spawned workers do not inherit it."""
+    logging.basicConfig(level=level, format=LOG_FORMAT)
+
+
+def _rewrite_chunk(layers: List[str], settings: InfillSettings, state: CarriedState, profiling: bool) -> Tuple[List[str], Optional[Profiler]]:
+    """Rewrite consecutive layers in a worker process of ``rewrite_layers_parallel``."""
+    profiler = Profiler() if profiling else None
+
+    return list(rewrite_layers(layers, settings, state, profiler)), profiler
+
+
+def _rewrite_ranges(path: str, ranges: List[Tuple[int, int]], settings: InfillSettings, state: CarriedState, profiling: bool) -> Tuple[List[str], Optional[Profiler]]:
+    """Rewrite consecutive layers given by their byte ranges in a worker process of ``rewrite_layers_parallel``."""
+    with open(path, "rb") as source, mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        return _rewrite_chunk((read_range(buffer, start, end) for start, end in ranges), settings, state, profiling)
+
+
+def rewrite_layers_parallel(layers: Iterable[str], settings: InfillSettings, workers: Optional[int] = None, chunk_size: int = 4,
+                            profiler: Optional[Profiler] = None, cache: Optional[LayerCache] = None) -> Iterator[str]:
+    """Rewrite the infill of the gcode layers in worker processes.
+
+    The state carried across layers is computed sequentially by ``carried_state``, then chunks
+    of ``chunk_size`` layers are rewritten in parallel. The output is identical to
+    ``rewrite_layers``. At most two chunks per worker are in flight, so the memory use stays
+    bounded for long layer streams. The layers of a ``LayerIndex`` are sent to the workers as
+    byte ranges of the file instead of strings. With a cache the cached layers are not sent to
+    the workers, the parent process reads and stores the cache entries.
+
+    The worker processes import this module by name, so this is meant for the command line and
+    batch use, not from inside Cura.
+
+    Args:
+        layers (Iterable[str] or LayerIndex): gcode split into layers, see ``read_layers``
+        settings (InfillSettings): the script settings
+        workers (Optional[int]): number of worker processes, the number of CPUs when None
+        chunk_size (int): number of layers rewritten by a worker at once
+        profiler (Optional[Profiler]): collects the timings of the workers when given, the times are summed over the workers
+        cache (Optional[LayerCache]): the layers rewritten before are taken from this cache and the others are stored in it
+
+    Yields:
+        str: the rewritten layer
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    def results(entry):
+        future, stored = entry
+        if stored is None:
+            # layer read from the cache
+            return [future]
+        chunk_layers, chunk_profiler = future.result()
+        if profiler is not None:
+            profiler.merge(chunk_profiler)
+        if cache is not None:
+            for (key, end_state), text in zip(stored, chunk_layers):
+                cache.put(key, text, end_state)
+        return chunk_layers
+
+    def submit(chunk, chunk_state):
+        if ranges is None:
+            return executor.submit(_rewrite_chunk, chunk, settings, chunk_state, profiling)
+        return executor.submit(_rewrite_ranges, layers.path, chunk, settings, chunk_state, profiling)
+
+    profiling = profiler is not None
+    ranges = layers.ranges() if isinstance(layers, LayerIndex) else None
+    workers = workers or os.cpu_count() or 1
+    state = INITIAL_STATE
+    pending = deque()
+    level = logging.getLogger("LinearlyVariableInfill").getEffectiveLevel()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(level,)) as executor:
+        chunk = []
+        stored = []
+        chunk_state = state
+        for layer_index, layer in enumerate(layers):
+            key = None
+            if cache is not None:
+                key = layer_key(layer, settings, state)
+                cached = cache.get(key)
+                if cached is not None:
+                    # the chunk before the cached layer is complete
+                    if chunk:
+                        pending.append((submit(chunk, chunk_state), stored))
+                        chunk = []
+                        stored = []
+                    text, state = cached
+                    pending.append((text, None))
+                    continue
+            if not chunk:
+                chunk_state = state
+            chunk.append(layer if ranges is None else ranges[layer_index])
+            state = carried_state(layer.split("\n"), state)
+            stored.append((key, state))
+            if len(chunk) >= chunk_size:
+                pending.append((submit(chunk, chunk_state), stored))
+                chunk = []
+                stored = []
+            while len(pending) > 2 * workers:
+                yield from results(pending.popleft())
+        if chunk:
+            pending.append((submit(chunk, chunk_state), stored))
+        while pending:
+            yield from results(pending.popleft())
+    if cache is not None:
+        Logger.log('d', cache.stats())
+
+
+def process_layers(data: List[str], settings: InfillSettings, profiler: Optional[Profiler] = None, cache: Optional[LayerCache] = None) -> List[str]:
+    """Rewrite the infill of the gcode layers in place.
+
+    Args:
+        data (List[str]): gcode split into layers as passed to ``Script.execute``
+        settings (InfillSettings): the script settings
+        profiler (Optional[Profiler]): collects the phase timings, counters and layer summaries when given
+        cache (Optional[LayerCache]): on-disk cache of the rewritten layers
+
+    Returns:
+        List[str]: ``data`` with the rewritten layers
+    """
+    for layer_index, layer in enumerate(rewrite_layers(data, settings, profiler=profiler, cache=cache)):
+        data[layer_index] = layer
+
+    return data
+
+
+def process_file(input_path: str, output_path: str, settings: InfillSettings, profiler: Optional[Profiler] = None) -> None:
+    """Rewrite the infill of a gcode file into another file, streaming line by line.
+
+    Only the current line and the perimeter of the current layer are kept in memory, so the
+    peak memory use does not depend on the size of the file. With a profiler the file is
+    processed layer by layer to summarize every layer.
+
+    Args:
+        input_path (str): gcode file to read
+        output_path (str): gcode file to write
+        settings (InfillSettings): the script settings
+        profiler (Optional[Profiler]): collects the phase timings, counters and layer summaries when given
+    """
+    with open(input_path, "r", encoding="utf-8", newline="\n") as source, \
+            open(output_path, "w", encoding="utf-8", newline="\n") as sink:
+        if profiler is not None:
+            for layer in rewrite_layers(read_layers(source), settings, profiler=profiler):
+                sink.write(layer)
+            return
+        rewriter = InfillRewriter(settings)
+        write_lines(rewriter.rewrite(SectionTracker().track(tokenize(iter_lines(source)))), sink)
+    Logger.log('d', rewriter.perimeterCache.stats())
+
+
 class LinearlyVariableInfill(Script):
     def getSettingDataString(self):
         return """{
@@ -326,6 +2630,54 @@ class LinearlyVariableInfill(Script):
                     "type": "int",
                     "default_value": 1
                 
+                },
+                "distanceFieldResolution":
+                {
+                    "label": "Tavolsagmezo felbontasa",
+                    "description": "Approximate the distance to the walls from a raster with this resolution, faster on dense infill when the walls repeat over many layers; the error is at most 0.71 x resolution. 0 calculates exact distances. Requires NumPy",
+                    "unit": "mm",
+                    "type": "float",
+                    "default_value": 0.0,
+                    "minimum_value": 0.0,
+                    "maximum_value_warning": 0.5
+                },
+                "adaptiveSubdivision":
+                {
+                    "label": "Adaptiv felosztas",
+                    "description": "Write the parts of the infill lines farther from the walls than the gradient distance as single moves instead of subdividing them; smaller gcode with the same extrusion",
+                    "type": "bool",
+                    "default_value": false
+                },
+                "layerCache":
+                {
+                    "label": "Reteg gyorsitotar",
+                    "description": "Keep the processed layers on disk, exporting the same gcode again with the same settings only processes the changed layers",
+                    "type": "bool",
+                    "default_value": false
+                },
+                "layerCacheSize":
+                {
+                    "label": "Reteg gyorsitotar merete",
+                    "description": "Disk space used by the layer cache, the least recently used layers are removed above it",
+                    "unit": "MB",
+                    "type": "int",
+                    "default_value": 512,
+                    "minimum_value": 1,
+                    "enabled": "layerCache"
+                },
+                "debugLines":
+                {
+                    "label": "Sorok naplozasa",
+                    "description": "Log every wall and infill line processed, only for debugging as it slows down big files",
+                    "type": "bool",
+                    "default_value": false
+                },
+                "profiling":
+                {
+                    "label": "Profilozas",
+                    "description": "Measure the time of the processing phases and show a report when the post-processing is done",
+                    "type": "bool",
+                    "default_value": false
                 }
             }
         }"""
@@ -337,9 +2689,29 @@ class LinearlyVariableInfill(Script):
 #
 ## -----------------------------------------------------------------------------
 
+    def extruder_properties(self, extruder_nr: int) -> Tuple[str, bool]:
+        """Read the infill settings of the extruder once for the job.
+
+        Args:
+            extruder_nr (int): index of the extruder, the last extruder when it is larger
+
+        Returns:
+            Tuple[str, bool]: the infill pattern and whether the infill lines are connected
+        """
+        from UM.Application import Application
+
+        extruders = Application.getInstance().getGlobalContainerStack().extruderList
+        extruder = extruders[min(extruder_nr, len(extruders) - 1)]
+
+        return extruder.getProperty("infill_pattern", "value"), bool(extruder.getProperty("zig_zaggify_infill", "value"))
+
     def execute(self, data):
+        from UM.Message import Message
+        from UM.Resources import Resources
+        from UM.i18n import i18nCatalog
+        catalog = i18nCatalog("cura")
+
         Logger.log('w', 'Plugin is starting '  )
-        print('naygvera')
         division_nr = float(self.getSettingValueByKey("divisionNR"))
         variable_segment_lengh = float(self.getSettingValueByKey("variableSegmentLength"))
         extruder_nr  = self.getSettingValueByKey("extruderNR")
@@ -349,33 +2721,17 @@ class LinearlyVariableInfill(Script):
         max_speed_factor = max_speed_factor /100
         min_speed_factor = float(self.getSettingValueByKey("minSpeedFactor"))
         min_speed_factor = min_speed_factor /100
-        
-
-        
+        distance_field_resolution = float(self.getSettingValueByKey("distanceFieldResolution"))
+        adaptive_subdivision = bool(self.getSettingValueByKey("adaptiveSubdivision"))
+        layer_cache = bool(self.getSettingValueByKey("layerCache"))
+        layer_cache_size = int(self.getSettingValueByKey("layerCacheSize"))
+        debug_lines = bool(self.getSettingValueByKey("debugLines"))
+        profiling = bool(self.getSettingValueByKey("profiling"))
+        infillpattern, connectinfill = self.extruder_properties(extruder_nr)
 
-        
-        
-        #   machine_extruder_count
-     #   extruder_count=Application.getInstance().getGlobalContainerStack().getProperty("machine_extruder_count", "value")
-      #  extruder_count = extruder_count-1
-       # if extruder_nr>extruder_count :
-        #    extruder_nr=extruder_count
-
-        
-        # Deprecation function
-        extrud = list(Application.getInstance().getGlobalContainerStack().extruders.values())
-        #extrud = Application.getInstance().getGlobalContainerStack().extruderList
-        Message('Extrud:{}'.format(extrud), title = catalog.i18nc("@info:title", "Post Processing")).show()
-        infillpattern = extrud[extruder_nr].getProperty("infill_pattern", "value")
-        connectinfill = extrud[extruder_nr].getProperty("zig_zaggify_infill", "value")
-        
-        
-        """Parse Gcode and modify infill portions with an extrusion width gradient."""
-        currentSection = Section.NOTHING
-        lastPosition = Point2D(-10000, -10000)
         littleSegmentLength = variable_segment_lengh / division_nr
 
-        infill_type=fill_type(infillpattern)
+        infill_type = pattern_type(infillpattern, connectinfill)
         if infill_type == 0:
             #
             Logger.log('d', 'Infill Pattern not supported : ' + infillpattern)
@@ -383,160 +2739,158 @@ class LinearlyVariableInfill(Script):
 
             return None
 
-        if connectinfill == True:
-            #
-            Logger.log('d', 'Connect Infill Lines no supported')
-            Message('Gcode must be generate without Connect Infill Lines mode activated' , title = catalog.i18nc("@info:title", "Post Processing")).show()
-            return None      
-
         Logger.log('d',  "GradientFill Param : " + str(littleSegmentLength) + "/" + str(division_nr)+ "/" + str(variable_segment_lengh) ) #str(max_flow) + "/" + str(min_flow) + "/" + 
         Logger.log('d',  "Pattern Param : " + infillpattern + "/" + str(infill_type) )
 
-        for layer in data:
-            layer_index = data.index(layer)
-            lines = layer.split("\n")
-            for currentLineINcode in lines:
-                new_Line=""
-                stringFeed = ""
-                line_index = lines.index(currentLineINcode)
-                
-                if is_layer(currentLineINcode):
-                    perimeterSegments = []
-                    
-                if is_innerwall(currentLineINcode):
-                    currentSection = Section.INNER_WALL
-                    # Logger.log('d', 'is_innerwall'  )
+        # Parse Gcode and modify infill portions with an extrusion width gradient
+        settings = InfillSettings(variable_segment_lengh, division_nr, variable_speed, max_speed_factor, min_speed_factor, infill_type, distance_field_resolution,
+                                  adaptive_subdivision=adaptive_subdivision, debug_lines=debug_lines)
 
-                if is_outerwall(currentLineINcode):
-                    currentSection = Section.OUTER_WALL
-                    # Logger.log('d', 'is_outerwall' )
-                    
-                if currentSection == Section.INNER_WALL:
-                    if ez_nyomtatasi_vonal(currentLineINcode):
-                        Logger.log('d', 'Ez sor rossz ' + currentLineINcode)
-                        perimeterSegments.append(Segment(getXY(currentLineINcode), lastPosition))
-                    
+        cache = None
+        if layer_cache:
+            cache = LayerCache(os.path.join(Resources.getCacheStoragePath(), "LinearlyVariableInfill"), layer_cache_size * 2 ** 20)
 
-                if is_infill(currentLineINcode):
-                    # Log Size of perimeterSegments for debuging
-                    Logger.log('d', 'PerimeterSegments seg : {}'.format(len(perimeterSegments)))
-                    currentSection = Section.INFILL
-                    # ! Important 
-                    continue
+        if not profiling:
+            return process_layers(data, settings, cache=cache)
 
-                if currentSection == Section.INFILL:
-                    if "F" in currentLineINcode and "G1" in currentLineINcode:
-                        searchSpeed = re.search(r"F(\d*\.?\d*)", currentLineINcode)
-                        
-                        if searchSpeed:
-                            current_speed=float(searchSpeed.group(1))
-                            new_Line="G1 F{}\n".format(current_speed)
-                        else:
-                            Logger.log('d', 'Gcode file parsing error for line : ' + currentLineINcode )
-
-                    if "E" in currentLineINcode and "G1" in currentLineINcode and "X" in currentLineINcode and "Y" in currentLineINcode:
-                        currentPosition = getXY(currentLineINcode)
-                        splitLine = currentLineINcode.split(" ")
-                        
-                        # ha lineraris  
-                        if infill_type == 1:
-                            for element in splitLine:
-                                if "E" in element:
-                                    E_inCode = float(element[1:])
-
-                            fullSegmentLength = two_points_distance(lastPosition, currentPosition)
-                            segmentSteps = fullSegmentLength / littleSegmentLength
-                            extrudeLengthPERsegment = (0.006584 * fullSegmentLength) / segmentSteps
-                            E_inCode_last = E_inCode - (extrudeLengthPERsegment * segmentSteps)
-                            littlesegmentDirectionandLength = Point2D((currentPosition.x - lastPosition.x) / fullSegmentLength * littleSegmentLength,(currentPosition.y - lastPosition.y) / fullSegmentLength * littleSegmentLength)
-                            speed_deficit = ((current_speed * max_speed_factor + current_speed * min_speed_factor) / division_nr)
-                            step_number = 0
-                            last_step_number = 0
-    
-    
-    
-    
-                            if segmentSteps >= 2:
-                                # new_Line=new_Line+"; LinearlyVariableInfill segmentSteps >= 2\n"
-                                for step in range(int(segmentSteps)):
-                                    segmentEnd = Point2D(lastPosition.x + littlesegmentDirectionandLength.x, lastPosition.y + littlesegmentDirectionandLength.y)
-                                    extrudeLength=E_inCode_last+extrudeLengthPERsegment
-                                    if perimeterSegments==[] : 
-                                        Logger.log('d', 'Itt a hiba ' + currentLineINcode)
-                                    shortestDistance = min_distance_to_segment(Segment(lastPosition, segmentEnd), perimeterSegments)
-                                    if shortestDistance < variable_segment_lengh:
-                                        segmentSpeed = current_speed 
-    
-                                        if variable_speed:
-                                            if variable_speed:                                         
-                                             
-                                             if step_number < division_nr:                                              
-                                                 segmentSpeed = current_speed * min_speed_factor + (speed_deficit * step_number)
-  
-                                             if step_number >= division_nr:                                            
-                                                 segmentSpeed = current_speed * max_speed_factor
- 
-                                             if step_number >= segmentSteps - division_nr:                                                 
-                                                 segmentSpeed = current_speed * max_speed_factor - (speed_deficit * last_step_number)
-                                                 last_step_number=last_step_number + 1
-                                            stringFeed = " F{}".format(int(segmentSpeed))
-
-                                    else:
-                                         segmentSpeed = current_speed * min_speed_factor
-                                            
-                                            
-                                         if variable_speed:                                            
-                                            if step_number < division_nr:                              
-                                                 segmentSpeed = current_speed * min_speed_factor + (speed_deficit * step_number)
-                                                 
-                                            if step_number >= division_nr:                                                 
-                                                 segmentSpeed = current_speed * max_speed_factor
-                                                 
-
-                                            if step_number >= segmentSteps - division_nr:                                             
-                                                 segmentSpeed = current_speed * max_speed_factor - (speed_deficit * last_step_number)
-                                                 last_step_number=last_step_number + 1
-
-                                            stringFeed = " F{}".format(int(segmentSpeed))
-
-                                    new_Line=new_Line + gcode_template(segmentEnd.x, segmentEnd.y, extrudeLength) + stringFeed + "\n" #szakaszExtrudalas
-                                    lastPosition  = segmentEnd
-                                    E_inCode_last = extrudeLength
-                                    step_number = step_number + 1 
-                                    
-                    
-                                segmentSpeed = current_speed * min_speed_factor
-                                lastSpeed = " F{}".format(int(segmentSpeed))
-                                new_Line=new_Line + gcode_template(currentPosition.x, currentPosition.y, E_inCode, ) + lastSpeed + "\n" #Original line for finish
-                                lines[line_index] = new_Line
-                                
-                            else :
-                                outPutLine = ""
-                                # outPutLine = "; LinearlyVariableInfill segmentSteps < 2\n"
-                               
-                                for element in splitLine:
-                                    if "E" in element:
-                                        outPutLine = outPutLine + "E" + str(round(E_inCode, 5))
-                                    else:
-                                        outPutLine = outPutLine + element + " "
-                                outPutLine = outPutLine # + "\n"
-                                lines[line_index] = outPutLine
-                                
-                            # writtenToFile = 1
-                            
-                 
-                    #
-                    # comment like ;MESH:NONMESH 
-                    #
-                    if ";" in currentLineINcode:
-                        currentSection = Section.NOTHING
-                        lines[line_index] = currentLineINcode # other Comment 
-                #
-                # line with move
-                #
-                if "X" in currentLineINcode and "Y" in currentLineINcode and ("G1" in currentLineINcode or "G0" in currentLineINcode):
-                    lastPosition  = getXY(currentLineINcode)
+        profiler = Profiler()
+        process_layers(data, settings, profiler, cache)
+        report = profiler.report()
+        Logger.log('i', report)
+        Message(report, title = catalog.i18nc("@info:title", "Post Processing")).show()
 
-            final_lines = "\n".join(lines)
-            data[layer_index] = final_lines
         return data
+
+
+## -----------------------------------------------------------------------------
+#
+#  Command line
+#
+## -----------------------------------------------------------------------------
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Post-process gcode files from the command line, without Cura.
+
+    Args:
+        argv (Optional[List[str]]): command line arguments, ``sys.argv[1:]`` when None
+
+    Returns:
+        int: the exit code
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="LinearlyVariableInfill", description="Apply the Linearly Variable Infill post-processing to gcode files sliced by Cura.")
+    parser.add_argument("inputs", nargs="+", metavar="GCODE", help="gcode files to process")
+    parser.add_argument("-o", "--output", help="output file, or output directory when several files are given (default: <name>_LVI.gcode next to the input)")
+    parser.add_argument("--infill-pattern", required=True, help="infill_pattern the gcode was sliced with, comma separated per extruder")
+    parser.add_argument("--connect-infill", action="store_true", help="the gcode was sliced with Connect Infill Lines (zig_zaggify_infill)")
+    parser.add_argument("--variable-segment-length", type=float, default=6.0, help="distance of the gradient (max to min) in mm (default: %(default)s)")
+    parser.add_argument("--division-nr", type=int, default=4, help="number of segments within the gradient (default: %(default)s)")
+    parser.add_argument("--variable-speed", action="store_true", help="vary the speed linked to the gradual flow")
+    parser.add_argument("--max-speed-factor", type=int, default=200, help="maximum over speed factor in %% (default: %(default)s)")
+    parser.add_argument("--min-speed-factor", type=int, default=60, help="minimum over speed factor in %% (default: %(default)s)")
+    parser.add_argument("--distance-field-resolution", type=float, default=0.0, help="approximate the wall distances from a raster with this resolution in mm, faster when the walls repeat over many layers, 0 for exact distances (default: %(default)s)")
+    parser.add_argument("--adaptive-subdivision", action="store_true", help="write the parts of the infill lines far from the walls as single moves")
+    parser.add_argument("--perimeter-cache-mb", type=float, default=PERIMETER_CACHE_BYTES / 2 ** 20, help="memory bound of the cache of perimeters reused by identical layers in MB (default: %(default)s)")
+    parser.add_argument("--cache-dir", help="keep the processed layers in this directory, processing the same gcode again only processes the changed layers")
+    parser.add_argument("--cache-size", type=float, default=LAYER_CACHE_BYTES / 2 ** 20, help="disk space used by --cache-dir in MB (default: %(default)s)")
+    parser.add_argument("--extruder-nr", type=int, default=1, help="extruder whose infill pattern is used (default: %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="number of worker processes, 0 for one per CPU (default: %(default)s)")
+    parser.add_argument("--mmap", action="store_true", help="memory-map the input files and decode one layer at a time, for very large files")
+    parser.add_argument("--chunk-size", type=int, default=4, help="number of layers per worker task with --jobs (default: %(default)s)")
+    parser.add_argument("--profile", metavar="FILE", help="write the timings of the processing phases and the slowest layers to FILE, - for stderr")
+    parser.add_argument("-v", "--verbose", action="count", default=0, help="log the processing details, twice to log every wall and infill line")
+    args = parser.parse_args(argv)
+    # the limits of the minimum_value and maximum_value of the settings in getSettingDataString
+    if args.variable_segment_length < 1:
+        parser.error("--variable-segment-length must be at least 1")
+    if args.division_nr < 1:
+        parser.error("--division-nr must be at least 1")
+    if not 100 <= args.max_speed_factor <= 400:
+        parser.error("--max-speed-factor must be between 100 and 400")
+    if not 10 <= args.min_speed_factor <= 100:
+        parser.error("--min-speed-factor must be between 10 and 100")
+    if args.distance_field_resolution < 0:
+        parser.error("--distance-field-resolution must not be negative")
+    if args.perimeter_cache_mb < 0:
+        parser.error("--perimeter-cache-mb must not be negative")
+    if args.cache_size < 1:
+        parser.error("--cache-size must be at least 1")
+    if args.jobs < 0:
+        parser.error("--jobs must not be negative")
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING, format=LOG_FORMAT)
+
+    patterns = args.infill_pattern.split(",")
+    if not 1 <= args.extruder_nr <= len(patterns):
+        parser.error("--extruder-nr {} has no --infill-pattern".format(args.extruder_nr))
+    infillpattern = patterns[args.extruder_nr - 1].strip()
+    infill_type = pattern_type(infillpattern, args.connect_infill)
+    if infill_type == 0:
+        parser.error("Infill Pattern not supported : " + infillpattern)
+    if len(args.inputs) > 1 and args.output and not os.path.isdir(args.output):
+        parser.error("--output must be a directory when several files are given")
+
+    settings = InfillSettings(args.variable_segment_length, float(args.division_nr), args.variable_speed,
+                              args.max_speed_factor / 100, args.min_speed_factor / 100, infill_type, args.distance_field_resolution,
+                              int(args.perimeter_cache_mb * 2 ** 20), args.adaptive_subdivision, args.verbose >= 2)
+
+    outputs = []
+    for input_path in args.inputs:
+        if args.output and os.path.isdir(args.output):
+            outputs.append(os.path.join(args.output, os.path.basename(input_path)))
+        elif args.output:
+            outputs.append(args.output)
+        else:
+            outputs.append(os.path.splitext(input_path)[0] + "_LVI.gcode")
+    # checked before any input is opened: replacing a file memory-mapped by LayerIndex or by the
+    # workers of --mmap would crash them, and hard links or bind mounts are not seen by realpath
+    inputs = {os.path.realpath(input_path) for input_path in args.inputs}
+    for output_path in outputs:
+        if os.path.realpath(output_path) in inputs or (os.path.exists(output_path) and
+                                                       any(os.path.samefile(output_path, input_path) for input_path in args.inputs)):
+            parser.error("the output {} would overwrite an input file".format(output_path))
+    if len({os.path.realpath(output_path) for output_path in outputs}) < len(outputs):
+        parser.error("several inputs would be written to the same output file")
+
+    cache = LayerCache(args.cache_dir, int(args.cache_size * 2 ** 20)) if args.cache_dir else None
+    reports = []
+    for input_path, output_path in zip(args.inputs, outputs):
+        Logger.log('i', 'Processing {} -> {}'.format(input_path, output_path))
+        profiler = Profiler() if args.profile else None
+        # the output is written next to its final path and renamed when complete, an
+        # interrupted run leaves no truncated gcode behind
+        temporary = "{}.{}.tmp".format(output_path, os.getpid())
+        try:
+            if args.jobs == 1 and cache is None and not args.mmap:
+                process_file(input_path, temporary, settings, profiler)
+            else:
+                with (LayerIndex(input_path) if args.mmap else open(input_path, "r", encoding="utf-8", newline="\n")) as source, \
+                        open(temporary, "w", encoding="utf-8", newline="\n") as sink:
+                    source_layers = source if args.mmap else read_layers(source)
+                    if args.jobs == 1:
+                        layers = rewrite_layers(source_layers, settings, profiler=profiler, cache=cache)
+                    else:
+                        layers = rewrite_layers_parallel(source_layers, settings, args.jobs or None, args.chunk_size, profiler, cache)
+                    for layer in layers:
+                        sink.write(layer)
+            os.replace(temporary, output_path)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+        if profiler is not None:
+            reports.append("{}\n{}\n".format(input_path, profiler.report()))
+
+    if args.profile == "-":
+        sys.stderr.write("\n".join(reports))
+    elif args.profile:
+        with open(args.profile, "w", encoding="utf-8") as report_file:
+            report_file.write("\n".join(reports))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
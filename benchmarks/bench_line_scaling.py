@@ -0,0 +1,130 @@
+"""
+Regression benchmark for the per-layer line processing of ``LinearlyVariableInfill.execute``.
+
+A single layer is grown up to 200k G-code lines; the time per line must stay flat when the
+layer grows, otherwise the processing is no longer linear in the number of lines. Every case
+runs other parts of the script: straight infill moves with the speed gradient, the same
+moves with the adaptive subdivision measuring the wall distances, and a chain of short
+moves in the polyline mode measuring the wall distances per bucket.
+
+    python benchmarks/bench_line_scaling.py [--cases variable adaptive polyline] [--max-ratio 1.5]
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import cura_stub  # noqa: E402
+
+SETTINGS = {
+    "variableSegmentLength": 6.0,
+    "divisionNR": 4,
+    "variableSpeed": True,
+    "maxSpeedFactor": 200,
+    "minSpeedFactor": 60,
+    "extruderNR": 1,
+    "distanceFieldResolution": 0.0,
+    "adaptiveSubdivision": False,
+    "layerCache": False,
+    "layerCacheSize": 512,
+    "debugLines": False,
+    "profiling": False,
+}
+
+
+def make_layer(line_count):
+    """Create one layer of ``line_count`` lines: a circular inner wall and short repeated infill moves."""
+    lines = [";LAYER:0", "G0 F6000 X140 Y100 Z0.2", ";TYPE:WALL-INNER"]
+    e = 0.0
+    for i in range(1, 201):
+        e += 0.05
+        lines.append("G1 X{:.3f} Y{:.3f} E{:.5f}".format(100 + 40 * math.cos(i * math.pi / 100), 100 + 40 * math.sin(i * math.pi / 100), e))
+    lines.append(";TYPE:FILL")
+    lines.append("G1 F2400")
+    i = 0
+    while len(lines) < line_count - 1:
+        y = 70 + (i % 600) * 0.1
+        e += 0.5
+        lines.append("G0 X{:.3f} Y{:.3f}".format(70, y))
+        lines.append("G1 X{:.3f} Y{:.3f} E{:.5f}".format(130 if i % 2 else 71.5, y, e))
+        i += 1
+    lines.append(";MESH:NONMESH")
+
+    return "\n".join(lines) + "\n"
+
+
+def make_chain_layer(line_count):
+    """Create one layer of ``line_count`` lines: a circular inner wall and waves of short chained infill moves."""
+    lines = [";LAYER:0", "G0 F6000 X140 Y100 Z0.2", ";TYPE:WALL-INNER"]
+    e = 0.0
+    for i in range(1, 201):
+        e += 0.05
+        lines.append("G1 X{:.3f} Y{:.3f} E{:.5f}".format(100 + 40 * math.cos(i * math.pi / 100), 100 + 40 * math.sin(i * math.pi / 100), e))
+    lines.append(";TYPE:FILL")
+    lines.append("G1 F2400")
+    i = 0
+    while len(lines) < line_count - 1:
+        y = 70 + (i % 600) * 0.1
+        lines.append("G0 X{:.3f} Y{:.3f}".format(70, y))
+        for step in range(1, 301):
+            if len(lines) >= line_count - 1:
+                break
+            e += 0.0066
+            lines.append("G1 X{:.3f} Y{:.3f} E{:.5f}".format(70 + step * 0.2, y + 0.5 * math.sin(step * 0.2), e))
+        i += 1
+    lines.append(";MESH:NONMESH")
+
+    return "\n".join(lines) + "\n"
+
+
+# Cases: infill pattern, changes of SETTINGS and layer generator
+CASES = {
+    "variable": ("lines", {}, make_layer),
+    "adaptive": ("lines", {"adaptiveSubdivision": True}, make_layer),
+    "polyline": ("gyroid", {"variableSpeed": False}, make_chain_layer),
+}
+
+
+def run(module, case, line_count):
+    """Process a layer of ``line_count`` lines in one case and return the elapsed seconds."""
+    pattern, changes, make = CASES[case]
+    cura_stub.Application.properties = {"infill_pattern": pattern, "zig_zaggify_infill": False}
+    script = module.LinearlyVariableInfill()
+    script.settings = dict(SETTINGS, **changes)
+    data = [";FLAVOR:Marlin\n", make(line_count)]
+    start = time.perf_counter()
+    script.execute(data)
+
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1].strip())
+    parser.add_argument("--cases", nargs="+", default=sorted(CASES), choices=sorted(CASES), help="cases to measure")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[25000, 50000, 100000, 200000], help="layer sizes in lines")
+    parser.add_argument("--max-ratio", type=float, default=1.5, help="allowed growth of the time per line from the smallest to the largest layer")
+    args = parser.parse_args()
+
+    module = cura_stub.load_script()
+    failed = False
+    for case in args.cases:
+        per_line = []
+        for size in args.sizes:
+            elapsed = run(module, case, size)
+            per_line.append(elapsed / size)
+            print("{:<9} {:>8} lines  {:8.3f} s  {:7.2f} us/line".format(case, size, elapsed, elapsed / size * 1e6))
+        ratio = per_line[-1] / per_line[0]
+        print("{:<9} time per line ratio {}/{}: {:.2f}".format(case, args.sizes[-1], args.sizes[0], ratio))
+        if ratio > args.max_ratio:
+            print("FAIL: {} processing time grows faster than linearly".format(case))
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
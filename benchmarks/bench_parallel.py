@@ -0,0 +1,75 @@
+"""
+Scaling benchmark of the layer-parallel processing of ``rewrite_layers_parallel``.
+
+Synthetic gcode is rewritten once serially and then with an increasing number of worker
+processes; every parallel output must be byte-identical to the serial one.
+
+    python benchmarks/bench_parallel.py [--layers 200] [--jobs 1 2 4 8 16]
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import LinearlyVariableInfill as lvi  # noqa: E402
+
+SETTINGS = lvi.InfillSettings(6.0, 4.0, True, 2.0, 0.6, 1)
+
+
+def make_layers(layer_count, infill_lines):
+    """Create a header and ``layer_count`` layers of a cylinder with line infill."""
+    layers = [";FLAVOR:Marlin\nG28\nG92 E0\n"]
+    e = 0.0
+    for layer in range(layer_count):
+        lines = [";LAYER:{}".format(layer), "G0 F6000 X140 Y100 Z{:.2f}".format(0.2 * (layer + 1)), ";TYPE:WALL-INNER", "G1 F1500"]
+        for i in range(1, 361):
+            e += 0.02
+            lines.append("G1 X{:.3f} Y{:.3f} E{:.5f}".format(100 + 40 * math.cos(i * math.pi / 180), 100 + 40 * math.sin(i * math.pi / 180), e))
+        lines.append(";TYPE:FILL")
+        lines.append("G1 F2400")
+        for i in range(infill_lines):
+            y = 62 + 76 * i / infill_lines
+            half = (40 ** 2 - (y - 100) ** 2) ** 0.5 - 0.5
+            e += 0.5
+            lines.append("G0 X{:.3f} Y{:.3f}".format(100 - half if i % 2 else 100 + half, y))
+            lines.append("G1 X{:.3f} Y{:.3f} E{:.5f}".format(100 + half if i % 2 else 100 - half, y, e))
+        lines.append(";MESH:NONMESH")
+        layers.append("\n".join(lines) + "\n")
+
+    return layers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1].strip())
+    parser.add_argument("--layers", type=int, default=200, help="number of layers")
+    parser.add_argument("--infill-lines", type=int, default=150, help="infill moves per layer")
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="worker counts to measure")
+    parser.add_argument("--chunk-size", type=int, default=4, help="layers per worker task")
+    args = parser.parse_args()
+
+    layers = make_layers(args.layers, args.infill_lines)
+    print("{} layers, {} CPUs".format(args.layers, os.cpu_count()))
+
+    start = time.perf_counter()
+    serial = list(lvi.rewrite_layers(layers, SETTINGS))
+    serial_time = time.perf_counter() - start
+    print("serial      {:8.3f} s".format(serial_time))
+
+    failed = False
+    for jobs in args.jobs:
+        start = time.perf_counter()
+        parallel = list(lvi.rewrite_layers_parallel(layers, SETTINGS, jobs, args.chunk_size))
+        elapsed = time.perf_counter() - start
+        identical = parallel == serial
+        failed |= not identical
+        print("{:>2} workers  {:8.3f} s  speedup {:5.2f}  {}".format(jobs, elapsed, serial_time / elapsed, "identical" if identical else "DIFFERENT OUTPUT"))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""
+Minimal stand-ins for the Cura/Uranium modules imported by the post-processing script.
+
+Only the calls made by ``LinearlyVariableInfill.execute`` are implemented, so the script can be
+benchmarked outside of Cura.
+"""
+
+import importlib.util
+import os
+import sys
+import tempfile
+import types
+
+SCRIPT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "LinearlyVariableInfill.py")
+
+
+class Script:
+    """Stand-in for ``PostProcessingPlugin.Script`` holding the setting values in a dict."""
+
+    def __init__(self, settings=None):
+        self.settings = dict(settings or {})
+
+    def getSettingValueByKey(self, key):
+        return self.settings[key]
+
+
+class Extruder:
+    """Stand-in for an extruder stack with fixed property values."""
+
+    def __init__(self, properties):
+        self.properties = properties
+
+    def getProperty(self, key, property_name):
+        return self.properties[key]
+
+
+class GlobalStack:
+    """Stand-in for the global container stack."""
+
+    def __init__(self, properties):
+        self.extruderList = [Extruder(properties)]
+
+
+class Application:
+    """Stand-in for ``UM.Application.Application``; ``properties`` holds the extruder settings."""
+
+    properties = {"infill_pattern": "lines", "zig_zaggify_infill": False}
+
+    @classmethod
+    def getInstance(cls):
+        return cls()
+
+    def getGlobalContainerStack(self):
+        return GlobalStack(self.properties)
+
+
+class Message:
+    """Stand-in for ``UM.Message.Message``, shown messages are collected in ``shown``."""
+
+    shown = []
+
+    def __init__(self, text="", title=""):
+        self.text = text
+        self.title = title
+
+    def show(self):
+        Message.shown.append(self.text)
+
+
+class Logger:
+    """Stand-in for ``UM.Logger.Logger`` that drops every log line."""
+
+    @staticmethod
+    def log(level, message):
+        pass
+
+
+class Resources:
+    """Stand-in for ``UM.Resources.Resources`` storing the cache in the temporary directory."""
+
+    @staticmethod
+    def getCacheStoragePath():
+        return tempfile.gettempdir()
+
+
+class i18nCatalog:
+    """Stand-in for ``UM.i18n.i18nCatalog``."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def i18nc(self, context, text):
+        return text
+
+
+def _module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__path__ = []
+    module.__dict__.update(attributes)
+    sys.modules[name] = module
+
+    return module
+
+
+def install():
+    """Register the stand-in modules in ``sys.modules``."""
+    _module("PostProcessingPlugin")
+    _module("PostProcessingPlugin.scripts")
+    _module("PostProcessingPlugin.Script", Script=Script)
+    _module("UM")
+    _module("UM.Logger", Logger=Logger)
+    _module("UM.Application", Application=Application)
+    _module("UM.Message", Message=Message)
+    _module("UM.Resources", Resources=Resources)
+    _module("UM.i18n", i18nCatalog=i18nCatalog)
+
+
+def load_script(path=SCRIPT_PATH):
+    """Import the post-processing script the way Cura does, as a module of the scripts package.
+
+    Args:
+        path (str): path of LinearlyVariableInfill.py
+
+    Returns:
+        module: the imported script module
+    """
+    install()
+    spec = importlib.util.spec_from_file_location("PostProcessingPlugin.scripts.LinearlyVariableInfill", path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+
+    return module
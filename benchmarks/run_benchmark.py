@@ -0,0 +1,181 @@
+"""
+Throughput benchmark of ``LinearlyVariableInfill.execute`` on synthetic gcode.
+
+The script runs inside the Cura stand-ins of ``cura_stub``. For every infill pattern and
+setting mode the gcode is processed once for timing and once under ``tracemalloc`` for the
+peak memory; the results (lines/sec, per-layer latency percentiles, peak memory) are
+printed and written as JSON, and a previous result file can be given to compare the runs.
+
+    python benchmarks/run_benchmark.py --output results.json [--compare previous.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import cura_stub  # noqa: E402
+import synthetic  # noqa: E402
+
+SETTINGS = {
+    "variableSegmentLength": 6.0,
+    "divisionNR": 4,
+    "variableSpeed": True,
+    "maxSpeedFactor": 200,
+    "minSpeedFactor": 60,
+    "extruderNR": 1,
+    "distanceFieldResolution": 0.0,
+    "adaptiveSubdivision": False,
+    "layerCache": False,
+    "layerCacheSize": 512,
+    "debugLines": False,
+    "profiling": False,
+}
+
+# Changes of SETTINGS per mode; every mode runs other parts of the script
+MODES = {
+    # speed gradient along the moves, the wall distances are not measured
+    "variable": {},
+    # constant speed, the polyline patterns measure the wall distances per bucket
+    "constant": {"variableSpeed": False},
+    # merging of the far sub-segments: grid, line sweep, far test and perimeter cache
+    "adaptive": {"adaptiveSubdivision": True},
+    # adaptive mode with the approximate distance field, needs NumPy
+    "field": {"adaptiveSubdivision": True, "distanceFieldResolution": 0.1},
+}
+DEFAULT_MODES = ["variable", "constant", "adaptive"]
+
+
+class TimedLayers(list):
+    """Layer list recording when ``execute`` writes back each processed layer."""
+
+    def __init__(self, layers):
+        super().__init__(layers)
+        self.times = []
+
+    def __setitem__(self, index, value):
+        self.times.append(time.perf_counter())
+        super().__setitem__(index, value)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of ``values``."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def run_pattern(module, pattern, mode, args):
+    """Benchmark one infill pattern in one mode and return its result record."""
+    layers = synthetic.generate(layers=args.layers, wall_points=args.wall_points, infill_spacing=args.infill_spacing, pattern=pattern)
+    line_count = sum(layer.count("\n") + 1 for layer in layers)
+    cura_stub.Application.properties = {"infill_pattern": pattern, "zig_zaggify_infill": bool(synthetic.PATTERNS[pattern].get("connect"))}
+    settings = dict(SETTINGS, **MODES[mode])
+
+    script = module.LinearlyVariableInfill()
+    script.settings = settings
+    data = TimedLayers(layers)
+    start = time.perf_counter()
+    result = script.execute(data)
+    elapsed = time.perf_counter() - start
+    if result is None:
+        raise RuntimeError("execute refused pattern {}".format(pattern))
+    latencies = [(end - begin) * 1000 for begin, end in zip([start] + data.times, data.times)]
+
+    script = module.LinearlyVariableInfill()
+    script.settings = settings
+    layers = list(layers)
+    tracemalloc.start()
+    script.execute(layers)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "pattern": pattern,
+        "mode": mode,
+        "lines": line_count,
+        "output_lines": sum(layer.count("\n") + 1 for layer in result),
+        "seconds": elapsed,
+        "lines_per_second": line_count / elapsed,
+        "layer_ms_p50": percentile(latencies, 0.50),
+        "layer_ms_p90": percentile(latencies, 0.90),
+        "layer_ms_p99": percentile(latencies, 0.99),
+        "layer_ms_max": max(latencies),
+        "peak_memory_bytes": peak,
+    }
+
+
+def git_revision():
+    """Commit of the benchmarked tree, if known."""
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(cura_stub.SCRIPT_PATH),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous_path):
+    """Print the change of the main metrics against a previous result file."""
+    with open(previous_path) as previous_file:
+        previous = {(record["pattern"], record.get("mode", "variable")): record for record in json.load(previous_file)["results"]}
+    print("\ncompared with {} ({}):".format(previous_path, "change of lines/sec, p90 latency, peak memory"))
+    for record in results:
+        old = previous.get((record["pattern"], record["mode"]))
+        if old is None:
+            continue
+        print("{:<14} {:<9} {:+7.1%} {:+7.1%} {:+7.1%}".format(
+            record["pattern"],
+            record["mode"],
+            record["lines_per_second"] / old["lines_per_second"] - 1,
+            record["layer_ms_p90"] / old["layer_ms_p90"] - 1,
+            record["peak_memory_bytes"] / old["peak_memory_bytes"] - 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1].strip())
+    parser.add_argument("--patterns", nargs="+", default=sorted(synthetic.PATTERNS), choices=sorted(synthetic.PATTERNS), help="infill patterns to benchmark")
+    parser.add_argument("--modes", nargs="+", default=DEFAULT_MODES, choices=sorted(MODES), help="setting modes to benchmark every pattern in")
+    parser.add_argument("--layers", type=int, default=20, help="number of layers")
+    parser.add_argument("--wall-points", type=int, default=360, help="vertices per wall")
+    parser.add_argument("--infill-spacing", type=float, default=2.0, help="distance between infill lines in mm")
+    parser.add_argument("--output", help="JSON file to write the results to")
+    parser.add_argument("--compare", help="JSON file of a previous run to compare with")
+    args = parser.parse_args()
+
+    module = cura_stub.load_script()
+    results = []
+    print("{:<14} {:<9} {:>9} {:>12} {:>9} {:>9} {:>9} {:>10}".format("pattern", "mode", "lines", "lines/sec", "p50 ms", "p90 ms", "p99 ms", "peak MB"))
+    for pattern in args.patterns:
+        for mode in args.modes:
+            record = run_pattern(module, pattern, mode, args)
+            results.append(record)
+            print("{pattern:<14} {mode:<9} {lines:>9} {lines_per_second:>12.0f} {layer_ms_p50:>9.1f} {layer_ms_p90:>9.1f} {layer_ms_p99:>9.1f} {peak:>10.1f}".format(
+                peak=record["peak_memory_bytes"] / 2 ** 20, **record))
+
+    if args.output:
+        report = {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": module.load_numpy() is not None,
+            "parameters": {"layers": args.layers, "wall_points": args.wall_points, "infill_spacing": args.infill_spacing, "settings": SETTINGS, "modes": {mode: MODES[mode] for mode in args.modes}},
+            "results": results,
+        }
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
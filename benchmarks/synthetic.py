@@ -0,0 +1,152 @@
+"""
+Synthetic Cura-style gcode for the benchmarks.
+
+The part is a wavy cylinder: every layer has an inner and an outer wall following a polygon
+with ``wall_points`` vertices and infill lines clipped to the inner wall. The infill line
+directions follow the supported infill patterns of the script. The chained patterns print
+their infill as chains of short moves: ``gyroid`` bends every line into a wave of
+``CHAIN_STEP`` long moves, ``zigzag`` connects the ends of consecutive lines like Connect
+Infill Lines.
+"""
+
+import math
+import random
+
+# Infill line directions in degrees per pattern; patterns with several directions per layer
+# print all of them, ``rotate`` patterns turn the directions by 90 degrees every layer.
+# ``wave`` bends the lines into waves of short moves, ``connect`` extrudes instead of
+# travelling between the lines and is sliced with zig_zaggify_infill.
+PATTERNS = {
+    "lines": {"angles": [45], "rotate": True},
+    "grid": {"angles": [45, 135], "rotate": False},
+    "triangles": {"angles": [0, 60, 120], "rotate": False},
+    "trihexagon": {"angles": [0, 60, 120], "rotate": False},
+    "cubic": {"angles": [0, 60, 120], "rotate": True},
+    "tetrahedral": {"angles": [45, 135], "rotate": True},
+    "quarter_cubic": {"angles": [0, 60, 120], "rotate": True},
+    "gyroid": {"angles": [0], "rotate": True, "wave": True},
+    "zigzag": {"angles": [0], "rotate": True, "connect": True},
+}
+
+# Length of the moves of the wave patterns in mm
+CHAIN_STEP = 0.2
+
+CENTER = 100.0
+FILAMENT_PER_MM = 0.033
+
+
+def wall_polygon(radius, wall_points, layer, waviness):
+    """Vertices of a closed wall of a wavy cylinder."""
+    points = []
+    for i in range(wall_points + 1):
+        angle = 2 * math.pi * i / wall_points
+        r = radius * (1 + waviness * math.sin(7 * angle + layer * 0.05))
+        points.append((CENTER + r * math.cos(angle), CENTER + r * math.sin(angle)))
+
+    return points
+
+
+def clip_line(polygon, origin, direction):
+    """Intersect an infinite line with a closed polygon.
+
+    Returns:
+        list: (start, end) points of the inside parts of the line
+    """
+    ox, oy = origin
+    dx, dy = direction
+    hits = []
+    for (x1, y1), (x2, y2) in zip(polygon, polygon[1:]):
+        ex = x2 - x1
+        ey = y2 - y1
+        denominator = dx * ey - dy * ex
+        if denominator == 0:
+            continue
+        t = ((x1 - ox) * ey - (y1 - oy) * ex) / denominator
+        u = ((x1 - ox) * dy - (y1 - oy) * dx) / denominator
+        if 0 <= u < 1:
+            hits.append(t)
+    hits.sort()
+
+    return [((ox + a * dx, oy + a * dy), (ox + b * dx, oy + b * dy)) for a, b in zip(hits[0::2], hits[1::2])]
+
+
+def generate(layers=50, wall_points=360, infill_spacing=2.0, pattern="grid", radius=40.0, waviness=0.05, seed=0):
+    """Generate gcode split into layers the way Cura passes it to ``Script.execute``.
+
+    Args:
+        layers (int): number of layers
+        wall_points (int): vertices of each wall, the wall complexity
+        infill_spacing (float): distance between infill lines in mm, the infill density
+        pattern (str): infill pattern, one of ``PATTERNS``
+        radius (float): radius of the part in mm
+        waviness (float): relative amplitude of the wall waves
+        seed (int): seed of the jitter of the infill lines
+
+    Returns:
+        list: the header followed by one string per layer
+    """
+    rnd = random.Random(seed)
+    directions = PATTERNS[pattern]
+    data = [";FLAVOR:Marlin\n;Generated with synthetic.py\n;LAYER_COUNT:{}\n".format(layers), "M82\nG28\nG92 E0\n"]
+    e = 0.0
+    position = (0.0, 0.0)
+
+    def extrude(lines, point, feed=None):
+        nonlocal e, position
+        e += FILAMENT_PER_MM * math.hypot(point[0] - position[0], point[1] - position[1])
+        position = point
+        lines.append("G1 {}X{:.3f} Y{:.3f} E{:.5f}".format("F{} ".format(feed) if feed else "", point[0], point[1], e))
+
+    def travel(lines, point):
+        nonlocal position
+        position = point
+        lines.append("G0 F6000 X{:.3f} Y{:.3f}".format(*point))
+
+    for layer in range(layers):
+        lines = [";LAYER:{}".format(layer), "M106 S255", "G0 F6000 X{:.3f} Y{:.3f} Z{:.2f}".format(CENTER, CENTER, 0.2 * (layer + 1))]
+        position = (CENTER, CENTER)
+        inner = wall_polygon(radius - 0.4, wall_points, layer, waviness)
+        outer = wall_polygon(radius, wall_points, layer, waviness)
+        for section, polygon in (("WALL-INNER", inner), ("WALL-OUTER", outer)):
+            travel(lines, polygon[0])
+            lines.append(";TYPE:" + section)
+            for i, point in enumerate(polygon[1:]):
+                extrude(lines, point, 1800 if i == 0 else None)
+        lines.append(";TYPE:FILL")
+        first = True
+        angle_offset = 90 * (layer % 2) if directions["rotate"] else 0
+        for angle in directions["angles"]:
+            theta = math.radians(angle + angle_offset)
+            direction = (math.cos(theta), math.sin(theta))
+            normal = (-direction[1], direction[0])
+            offset = -radius * 1.2
+            flip = False
+            while offset < radius * 1.2:
+                origin = (CENTER + normal[0] * offset, CENTER + normal[1] * offset)
+                for start, end in clip_line(inner, origin, direction):
+                    if flip:
+                        start, end = end, start
+                    if directions.get("connect") and not first:
+                        extrude(lines, start)
+                    else:
+                        travel(lines, start)
+                    if directions.get("wave"):
+                        length = math.hypot(end[0] - start[0], end[1] - start[1])
+                        steps = max(1, int(length / CHAIN_STEP))
+                        amplitude = infill_spacing / 4
+                        for step in range(1, steps):
+                            along = length * step / steps
+                            across = amplitude * math.sin(along * 2 * math.pi / (4 * infill_spacing))
+                            point = (start[0] + (end[0] - start[0]) * step / steps + normal[0] * across,
+                                     start[1] + (end[1] - start[1]) * step / steps + normal[1] * across)
+                            extrude(lines, point, 2400 if first else None)
+                            first = False
+                    extrude(lines, end, 2400 if first else None)
+                    first = False
+                    flip = not flip
+                offset += infill_spacing * (1 + 0.02 * rnd.random())
+        lines.append(";MESH:NONMESH")
+        data.append("\n".join(lines) + "\n")
+    data.append(";End of Gcode\nM104 S0\nM140 S0\n")
+
+    return data
@@ -0,0 +1,142 @@
+"""
+The fast paths of LinearlyVariableInfill give the same results as the reference implementations.
+
+    python -m pytest -q tests
+"""
+
+import os
+import random
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import LinearlyVariableInfill as lvi  # noqa: E402
+import synthetic  # noqa: E402
+
+LIMIT = 6.0
+
+SETTINGS = {
+    "variable": lvi.InfillSettings(6.0, 4.0, True, 2.0, 0.6, lvi.Infill.LINEAR.value),
+    "constant": lvi.InfillSettings(6.0, 4.0, False, 2.0, 0.6, lvi.Infill.LINEAR.value),
+    "adaptive": lvi.InfillSettings(6.0, 4.0, True, 2.0, 0.6, lvi.Infill.LINEAR.value, adaptive_subdivision=True),
+    "polyline": lvi.InfillSettings(6.0, 4.0, False, 2.0, 0.6, lvi.Infill.POLYLINE.value),
+}
+
+PATTERNS = {"variable": "grid", "constant": "grid", "adaptive": "grid", "polyline": "gyroid"}
+
+
+def random_walls(rnd, count):
+    """Random wall segments, short ones along closed loops and long ones across the area."""
+    walls = []
+    for _ in range(count):
+        x = rnd.uniform(0, 40)
+        y = rnd.uniform(0, 40)
+        length = rnd.choice([0.3, 2.0, 15.0])
+        walls.append(lvi.Segment(lvi.Point2D(x, y), lvi.Point2D(x + rnd.uniform(-length, length), y + rnd.uniform(-length, length))))
+
+    return walls
+
+
+def grid_of(walls):
+    segments = lvi.PerimeterStore()
+    for wall in walls:
+        segments.append(wall)
+    grid = lvi.PerimeterGrid(segments, LIMIT)
+    grid.sync()
+
+    return grid, [segments[index] for index in range(len(segments))]
+
+
+def brute_force(point, walls):
+    return lvi.min_distance_to_segment(lvi.Segment(point, point), walls)
+
+
+def check_distance(found, expected):
+    if expected < LIMIT:
+        assert found == expected
+    else:
+        assert found >= LIMIT
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_min_distance(seed):
+    rnd = random.Random(seed)
+    grid, walls = grid_of(random_walls(rnd, 60))
+    points = [lvi.Point2D(rnd.uniform(-10, 50), rnd.uniform(-10, 50)) for _ in range(300)]
+
+    for point, batched in zip(points, grid.min_distances(points, LIMIT)):
+        expected = brute_force(point, walls)
+        check_distance(grid.min_distance(point, LIMIT), expected)
+        check_distance(batched, expected)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_min_distances_on_line(seed):
+    rnd = random.Random(seed)
+    grid, walls = grid_of(random_walls(rnd, 60))
+    for _ in range(30):
+        start = lvi.Point2D(rnd.uniform(-10, 50), rnd.uniform(-10, 50))
+        end = lvi.Point2D(rnd.uniform(-10, 50), rnd.uniform(-10, 50))
+        steps = max(1, int(lvi.two_points_distance(start, end) / 0.5))
+        points = [lvi.Point2D(start.x + (end.x - start.x) * (i + 0.5) / steps, start.y + (end.y - start.y) * (i + 0.5) / steps) for i in range(steps)]
+
+        for point, found in zip(points, grid.min_distances_on_line(points, LIMIT)):
+            check_distance(found, brute_force(point, walls))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_gcode_moves(seed):
+    rnd = random.Random(seed)
+    points = [lvi.Point2D(rnd.uniform(-300, 300), rnd.choice([0.0, 100.0, rnd.uniform(-300, 300)])) for _ in range(200)]
+    extrusions = [rnd.choice([rnd.uniform(0, 5000), round(rnd.uniform(0, 10), 2), 1.0]) for _ in points]
+    feeds = [rnd.choice(["", " F1800", " F2400.5"]) for _ in points]
+    expected = "".join(lvi.gcode_template(point.x, point.y, extrusion) + feed + "\n" for point, extrusion, feed in zip(points, extrusions, feeds))
+
+    assert lvi.gcode_moves(points, extrusions, feeds) == expected
+    # tiny relative extrusions are written in exponent notation by round
+    assert lvi.gcode_moves(points[:2], [0.00005, 1.0], feeds[:2]) == "".join(
+        lvi.gcode_template(point.x, point.y, extrusion) + feed + "\n" for point, extrusion, feed in zip(points, [0.00005, 1.0], feeds))
+
+
+@pytest.fixture(scope="module", params=sorted(SETTINGS))
+def case(request):
+    data = synthetic.generate(layers=6, wall_points=120, infill_spacing=3.0, pattern=PATTERNS[request.param], radius=15.0)
+    settings = SETTINGS[request.param]
+
+    return data, settings, list(lvi.rewrite_layers(data, settings))
+
+
+def test_rewrite_layers_parallel(case):
+    data, settings, expected = case
+
+    assert list(lvi.rewrite_layers_parallel(data, settings, workers=2, chunk_size=2)) == expected
+
+
+def test_layer_index(case, tmp_path):
+    data, settings, expected = case
+    path = str(tmp_path / "input.gcode")
+    with open(path, "w", newline="") as stream:
+        stream.write("".join(data))
+
+    with lvi.LayerIndex(path) as layers:
+        serial = "".join(lvi.rewrite_layers(layers, settings))
+    with lvi.LayerIndex(path) as layers:
+        parallel = "".join(lvi.rewrite_layers_parallel(layers, settings, workers=2, chunk_size=2))
+
+    assert serial == "".join(expected)
+    assert parallel == "".join(expected)
+
+
+def test_layer_cache(case, tmp_path):
+    data, settings, expected = case
+    cache = lvi.LayerCache(str(tmp_path / "cache"))
+
+    assert list(lvi.rewrite_layers(data, settings, cache=cache)) == expected
+    assert cache.hits == 0
+    assert list(lvi.rewrite_layers(data, settings, cache=cache)) == expected
+    assert cache.hits == len(data)
+    assert list(lvi.rewrite_layers_parallel(data, settings, workers=2, chunk_size=2, cache=cache)) == expected